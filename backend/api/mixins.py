@@ -1,40 +1,233 @@
+import hashlib
+import logging
+import math
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework.response import Response
+from services.local_cache import local_cache
 from services.redis import redis_client
+from .relationships import RelationshipContext
+
+
+logger = logging.getLogger(__name__)
 
 
 class CachedListMixin:
     cache_prefix = None
     cache_ttl = 3600
+    cache_user_params = ()
+    cache_stale_ttl = 60
+    cache_lock_timeout = 10
+    cache_lock_wait = 2.0
+    cache_poll_interval = 0.05
+    cache_early_refresh_beta = 1.0
+    cache_local = False
+    cache_local_ttl = 300
+
+    def get_cache_key(self, request):
+        params = request.query_params.dict()
+        user = request.user
+        if user.is_authenticated and any(
+            param in params for param in self.cache_user_params
+        ):
+            params["__user"] = user.pk
+        return redis_client.make_cache_key(self.cache_prefix, **params)
+
+    def get_cache_tags(self, items):
+        return [self.cache_prefix]
+
+    def apply_user_overlay(self, items):
+        return items
 
     def list(self, request, *args, **kwargs):
         assert self.cache_prefix, "cache_prefix is required"
 
-        cache_key = redis_client.make_cache_key(
-            self.cache_prefix,
-            **request.query_params.dict()
-        )
+        cache_key = self.get_cache_key(request)
+
+        if self.cache_local:
+            data = local_cache.get(cache_key)
+            if data is not None:
+                return self._cached_response(data)
+
+        entry = redis_client.cache_get_entry(cache_key)
+        if entry is not None and not self._needs_refresh(entry):
+            self._store_local(cache_key, entry)
+            return self._cached_response(entry["value"])
 
-        cached = redis_client.cache_get(cache_key)
-        if cached is not None:
-            return Response(cached)
+        token = redis_client.acquire_lock(cache_key, self.cache_lock_timeout)
+        if token is None:
+            if entry is None:
+                entry = self._wait_for_entry(cache_key)
+            if entry is not None:
+                return self._cached_response(entry["value"])
+
+        try:
+            return self._build_list_response(cache_key)
+        finally:
+            if token is not None:
+                redis_client.release_lock(cache_key, token)
+
+    def _needs_refresh(self, entry):
+        expires = entry["expires"]
+        if self.cache_early_refresh_beta:
+            # Probabilistic early expiration: slow entries refresh sooner.
+            expires += (
+                entry.get("delta", 0.0)
+                * self.cache_early_refresh_beta
+                * math.log(1.0 - random.random())
+            )
+        return time.time() >= expires
 
+    def _wait_for_entry(self, cache_key):
+        deadline = time.monotonic() + self.cache_lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(self.cache_poll_interval)
+            entry = redis_client.cache_get_entry(cache_key)
+            if entry is not None:
+                return entry
+        return None
+
+    def _cached_response(self, data):
+        if isinstance(data, dict):
+            data = {
+                **data,
+                "results": self.apply_user_overlay(data["results"]),
+            }
+        else:
+            data = self.apply_user_overlay(data)
+        return Response(data)
+
+    def _store_local(self, cache_key, entry):
+        if not self.cache_local:
+            return
+        ttl = min(self.cache_local_ttl, entry["expires"] - time.time())
+        if ttl > 0:
+            local_cache.set(
+                cache_key,
+                entry["value"],
+                ttl=ttl,
+                tags=entry.get("tags", ()),
+            )
+
+    def _build_list_response(self, cache_key):
+        started = time.monotonic()
+        generation = redis_client.cache_generation()
         queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
 
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             response = self.get_paginated_response(serializer.data)
-            redis_client.cache_set(
-                cache_key,
-                response.data,
-                ttl=self.cache_ttl
-            )
-            return response
+        else:
+            serializer = self.get_serializer(queryset, many=True)
+            response = Response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
-        redis_client.cache_set(
+        entry = redis_client.cache_set_entry(
             cache_key,
-            serializer.data,
-            ttl=self.cache_ttl
+            response.data,
+            ttl=self.cache_ttl,
+            stale_ttl=self.cache_stale_ttl,
+            delta=time.monotonic() - started,
+            tags=self.get_cache_tags(serializer.data),
+            generation=generation,
         )
-        return Response(serializer.data)
+        if entry is not None:
+            self._store_local(cache_key, entry)
+        return response
+
+
+class RelationshipContextMixin:
+    def get_relationships(self):
+        if not hasattr(self, "_relationships"):
+            self._relationships = RelationshipContext(self.request.user)
+        return self._relationships
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["relationships"] = self.get_relationships()
+        return context
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMixin:
+    query_budget = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+
+        budget = self.query_budget.get(getattr(self, "action", None))
+        if budget is not None and counter.count > budget:
+            message = (
+                f"{type(self).__name__}.{self.action}: "
+                f"{counter.count} queries, budget {budget}"
+            )
+            if getattr(settings, "QUERY_BUDGET_RAISE", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class ConditionalGetMixin:
+    def get_list_version(self, request):
+        return None
+
+    def get_detail_version(self, request):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(
+            self.get_list_version(request),
+            super().list,
+            request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(
+            self.get_detail_version(request),
+            super().retrieve,
+            request, *args, **kwargs
+        )
+
+    def _conditional(self, version, handler, request, *args, **kwargs):
+        if version is None:
+            return handler(request, *args, **kwargs)
+
+        stamp, last_modified = version
+        source = f"{request.get_host()}|{request.get_full_path()}|{stamp}"
+        etag = quote_etag(hashlib.sha1(source.encode()).hexdigest())
+        if last_modified is not None:
+            last_modified = int(last_modified)
+
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified,
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(last_modified)
+            patch_vary_headers(response, ("Authorization",))
+        return response
@@ -0,0 +1,11 @@
+from rest_framework.negotiation import BaseContentNegotiation
+
+
+class ExportContentNegotiation(BaseContentNegotiation):
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderer = renderers[0]
+        return renderer, renderer.media_type
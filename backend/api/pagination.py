@@ -0,0 +1,184 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CustomPageNumberPagination(PageNumberPagination):
+    page_size = 6
+    page_size_query_param = "limit"
+    page_query_param = "page"
+    max_page_size = 100
+
+
+class KeysetPagination(CustomPageNumberPagination):
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Некорректный курсор"
+    unsupported_ordering_message = "Курсор не поддерживает эту сортировку"
+    keyset = ("-created_at", "-id")
+
+    def use_cursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.use_cursor(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.cursor_fields = self.get_keyset(queryset)
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+        if values is not None:
+            values = self.parse_cursor_values(queryset.model, values)
+
+        ordering = self.cursor_fields
+        if reverse:
+            ordering = tuple(
+                self._invert(field) for field in self.cursor_fields
+            )
+
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(ordering, values))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.rows:
+            return None
+        return self._cursor_link(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.rows:
+            return None
+        return self._cursor_link(self.rows[0], reverse=True)
+
+    def get_keyset(self, queryset):
+        ordering = tuple(queryset.query.order_by)
+        if not ordering:
+            return self.keyset
+        names = {field.name for field in queryset.model._meta.concrete_fields}
+        if not all(
+            isinstance(field, str) and field.lstrip("-") in names
+            for field in ordering
+        ) or ordering[-1].lstrip("-") != "id":
+            raise ParseError(self.unsupported_ordering_message)
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values = payload["v"]
+            reverse = bool(payload["r"])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(
+            self.cursor_fields
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def parse_cursor_values(self, model, values):
+        parsed = []
+        for field, value in zip(self.cursor_fields, values):
+            if not isinstance(value, (str, int, float)) or isinstance(
+                value, bool
+            ):
+                raise NotFound(self.invalid_cursor_message)
+            model_field = model._meta.get_field(field.lstrip("-"))
+            try:
+                parsed.append(model_field.to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if parsed[-1] is None:
+                raise NotFound(self.invalid_cursor_message)
+        return parsed
+
+    def encode_cursor(self, values, reverse):
+        values = [
+            value.isoformat() if hasattr(value, "isoformat") else value
+            for value in values
+        ]
+        payload = json.dumps(
+            {"v": values, "r": int(reverse)},
+            separators=(",", ":"),
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def _cursor_link(self, row, reverse):
+        values = [
+            getattr(row, field.lstrip("-")) for field in self.cursor_fields
+        ]
+        url = remove_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param,
+        )
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(values, reverse),
+        )
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @staticmethod
+    def _after(ordering, values):
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            clause = Q(**{f"{name}__{lookup}": values[index]})
+            for previous, value in zip(ordering[:index], values[:index]):
+                clause &= Q(**{previous.lstrip("-"): value})
+            condition |= clause
+        return condition
+
+
+class SubscriptionPagination(KeysetPagination):
+    keyset = ("id",)
+
+
+class UserSearchPagination(KeysetPagination):
+    page_size = 10
+    keyset = ("id",)
+
+    def use_cursor(self, request):
+        return True
@@ -0,0 +1,35 @@
+from functools import cached_property
+
+
+class RelationshipContext:
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def following_ids(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(
+            self.user.follower.values_list("following_id", flat=True)
+        )
+
+    def is_subscribed(self, user_id):
+        return user_id in self.following_ids
+
+    def favorited_ids(self, recipe_ids):
+        if not self.user.is_authenticated or not recipe_ids:
+            return frozenset()
+        return frozenset(
+            self.user.favourites.filter(
+                recipe_id__in=recipe_ids
+            ).values_list("recipe_id", flat=True)
+        )
+
+    def in_cart_ids(self, recipe_ids):
+        if not self.user.is_authenticated or not recipe_ids:
+            return frozenset()
+        return frozenset(
+            self.user.shopping_carts.filter(
+                recipe_id__in=recipe_ids
+            ).values_list("recipe_id", flat=True)
+        )
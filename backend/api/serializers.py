@@ -1,9 +1,16 @@
 import base64
+from collections import Counter
 from django.core.files.base import ContentFile
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
+from users.counters import recipe_update_fields
 from users.models import User, Favourite, Follow
+from users.shopping_list import apply_recipes
 from rest_framework import serializers
+from recipes.cards import refresh_recipe_cards
+from recipes.ingredient_index import index_recipe
 from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.search import ORDERINGS
 
 
 MIN_INGREDIENT_AMOUNT = 1
@@ -11,7 +18,7 @@ MAX_INGREDIENT_AMOUNT = 32000
 
 
 class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField(
         min_value=MIN_INGREDIENT_AMOUNT,
         max_value=MAX_INGREDIENT_AMOUNT,
@@ -34,6 +41,12 @@ class RecipeIngredientReadSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
+def ordered_ingredients(recipe):
+    return sorted(
+        recipe.recipe_ingredients.all(), key=lambda row: row.ingredient.name
+    )
+
+
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith("data:image/"):
@@ -67,9 +80,19 @@ class UserSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
+        relationships = self.context.get("relationships")
+        if relationships is not None:
+            return relationships.is_subscribed(obj.id)
         return request.user.follower.filter(following=obj).exists()
 
 
+class ShortUserSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ("id", "username", "avatar")
+
+
 class CustomUserCreateSerializer(UserCreateSerializer):
 
     class Meta(UserCreateSerializer.Meta):
@@ -118,15 +141,46 @@ class RecipeSerializer(serializers.ModelSerializer):
     def get_is_favorited(self, obj):
         request = self.context.get("request")
         if request and request.user.is_authenticated:
+            annotated = getattr(obj, "is_favorited", None)
+            if annotated is not None:
+                return annotated
             return obj.in_favourites.filter(user=request.user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get("request")
         if request and request.user.is_authenticated:
+            annotated = getattr(obj, "is_in_shopping_cart", None)
+            if annotated is not None:
+                return annotated
             return obj.in_shopping_carts.filter(user=request.user).exists()
         return False
 
+    def validate_ingredients(self, value):
+        ingredient_ids = [item["id"] for item in value]
+        ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        errors = []
+        missing = sorted(set(ingredient_ids) - set(ingredients))
+        if missing:
+            errors.append(
+                "Ингредиенты не найдены: "
+                + ", ".join(map(str, missing))
+            )
+        duplicates = sorted(
+            pk for pk, count in Counter(ingredient_ids).items() if count > 1
+        )
+        if duplicates:
+            errors.append(
+                "Обнаружены дубликаты ингредиентов: "
+                + ", ".join(map(str, duplicates))
+            )
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [
+            {"ingredient": ingredients[item["id"]], "amount": item["amount"]}
+            for item in value
+        ]
+
     def validate(self, data):
         if "ingredients" not in self.initial_data:
             raise serializers.ValidationError(
@@ -141,55 +195,91 @@ class RecipeSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         ingredients_data = validated_data.pop("ingredients", [])
 
-        ingredient_ids = [ing["id"] for ing in ingredients_data]
-        if len(ingredient_ids) != len(set(ingredient_ids)):
-            raise serializers.ValidationError(
-                {"ingredients": "Обнаружены дубликаты ингредиентов"},
-                code="duplicate_ingredients",
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                author=self.context["request"].user, **validated_data
             )
-
-        recipe = Recipe.objects.create(
-            author=self.context["request"].user, **validated_data
-        )
-        self._save_ingredients(recipe, ingredients_data)
+            self._save_ingredients(
+                recipe,
+                ingredients_data,
+                *self._ingredient_changes(recipe, ingredients_data),
+            )
+            refresh_recipe_cards([recipe.pk])
         return recipe
 
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop("ingredients", [])
 
-        ingredient_ids = [ing["id"] for ing in ingredients_data]
-        if len(ingredient_ids) != len(set(ingredient_ids)):
-            raise serializers.ValidationError(
-                {"ingredients": "Обнаружены дубликаты ингредиентов"},
-                code="duplicate_ingredients",
+        with transaction.atomic():
+            # Concurrent edits must diff against the committed ingredients.
+            Recipe.objects.select_for_update().only("pk").get(pk=instance.pk)
+            # Saving the recipe rebuilds its card, so ingredients go first.
+            changes = self._ingredient_changes(
+                instance,
+                ingredients_data,
+                instance.recipe_ingredients.order_by(),
             )
-
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-
-        self._save_ingredients(instance, ingredients_data)
+            if any(changes):
+                apply_recipes([instance.pk], -1)
+                self._save_ingredients(instance, ingredients_data, *changes)
+                apply_recipes([instance.pk], 1)
+
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save(update_fields=recipe_update_fields())
         return instance
 
-    def _save_ingredients(self, recipe, ingredients_data):
-        recipe.recipe_ingredients.all().delete()
-
-        new_ingredients = [
-            RecipeIngredient(
-                recipe=recipe,
-                ingredient=ing["id"],
-                amount=ing["amount"]
+    def _ingredient_changes(self, recipe, ingredients_data, current=()):
+        rows, duplicates = {}, []
+        for row in current:
+            if row.ingredient_id in rows:
+                duplicates.append(row)
+            else:
+                rows[row.ingredient_id] = row
+        created, updated = [], []
+        for ing in ingredients_data:
+            row = rows.pop(ing["ingredient"].pk, None)
+            if row is None:
+                created.append(RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ing["ingredient"],
+                    amount=ing["amount"]
+                ))
+            elif row.amount != ing["amount"]:
+                row.amount = ing["amount"]
+                updated.append(row)
+        return created, updated, [*rows.values(), *duplicates]
+
+    def _save_ingredients(self, recipe, ingredients_data, created, updated,
+                          removed):
+        if removed:
+            RecipeIngredient.objects.filter(
+                id__in=[row.pk for row in removed]
+            ).delete()
+        if updated:
+            RecipeIngredient.objects.bulk_update(updated, ["amount"])
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+
+        if created or removed:
+            recipe_id = recipe.pk
+            ingredient_ids = [
+                ing["ingredient"].pk for ing in ingredients_data
+            ]
+            transaction.on_commit(
+                lambda: index_recipe(recipe_id, ingredient_ids)
             )
-            for ing in ingredients_data
-        ]
-        recipe.recipe_ingredients.bulk_create(new_ingredients)
 
     def get_ingredients(self, obj):
         return RecipeIngredientReadSerializer(
-            obj.recipe_ingredients.all(),
+            ordered_ingredients(obj),
             many=True).data
 
     def to_representation(self, instance):
+        card = getattr(instance, "card_data", None)
+        if card is not None:
+            return self._card_representation(instance, card)
+
         representation = super().to_representation(instance)
 
         representation["is_favorited"] = self.get_is_favorited(instance)
@@ -198,10 +288,57 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
         representation["ingredients"] = RecipeIngredientReadSerializer(
-            instance.recipe_ingredients.all(), many=True
+            ordered_ingredients(instance), many=True
         ).data
         return representation
 
+    def _card_representation(self, instance, card):
+        author = card["author"]
+        return {
+            "id": card["id"],
+            "author": {
+                "email": author["email"],
+                "id": author["id"],
+                "username": author["username"],
+                "first_name": author["first_name"],
+                "last_name": author["last_name"],
+                "is_subscribed": self._is_subscribed(author["id"]),
+                "avatar": self._absolute_url(author["avatar"]),
+            },
+            "name": card["name"],
+            "image": self._absolute_url(card["image"]),
+            "text": card["text"],
+            "cooking_time": card["cooking_time"],
+            "is_favorited": self.get_is_favorited(instance),
+            "is_in_shopping_cart": self.get_is_in_shopping_cart(instance),
+            "ingredients": [
+                {
+                    "id": item["id"],
+                    "name": item["name"],
+                    "measurement_unit": item["measurement_unit"],
+                    "amount": item["amount"],
+                }
+                for item in card["ingredients"]
+            ],
+        }
+
+    def _is_subscribed(self, author_id):
+        request = self.context.get("request")
+        if not request or request.user.is_anonymous:
+            return False
+        relationships = self.context.get("relationships")
+        if relationships is not None:
+            return relationships.is_subscribed(author_id)
+        return request.user.follower.filter(following_id=author_id).exists()
+
+    def _absolute_url(self, url):
+        if not url:
+            return None
+        request = self.context.get("request")
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
 
 class FavoriteSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
@@ -282,3 +419,27 @@ class FollowCreateSerializer(serializers.ModelSerializer):
                 "Вы уже подписаны на этого пользователя."
             )
         return data
+
+
+class RecipeSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, allow_blank=True, default="")
+    author = serializers.IntegerField(required=False, min_value=1)
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        max_length=20,
+    )
+    cooking_time_min = serializers.IntegerField(required=False, min_value=1)
+    cooking_time_max = serializers.IntegerField(required=False, min_value=1)
+    ordering = serializers.ChoiceField(
+        choices=list(ORDERINGS),
+        required=False,
+    )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
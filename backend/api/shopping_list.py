@@ -0,0 +1,144 @@
+import csv
+import hashlib
+import json
+import uuid
+
+from django.db.models import Sum
+
+from services.redis import redis_client
+from users.models import ShoppingListItem
+from users.shopping_list import get_list_version
+
+
+TITLE = "Список покупок"
+CHUNK_SIZE = 500
+ARTIFACT_TTL = 86400
+PENDING_TTL = 300
+
+
+def shopping_list_rows(user_id):
+    return ShoppingListItem.objects.filter(
+        user_id=user_id,
+    ).values_list(
+        "ingredient__name",
+        "ingredient__measurement_unit",
+    ).annotate(
+        total=Sum("amount"),
+    ).order_by(
+        "ingredient__name", "ingredient__measurement_unit"
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def render_txt(rows):
+    yield f"{TITLE}:\n\n"
+    for name, unit, total in rows:
+        yield f"{name} - {total} {unit}\n"
+
+
+class _Line:
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(("name", "measurement_unit", "amount"))
+    for name, unit, total in rows:
+        yield writer.writerow((name, unit, total))
+
+
+def render_json(rows):
+    yield "["
+    separator = ""
+    for name, unit, total in rows:
+        item = json.dumps(
+            {"name": name, "measurement_unit": unit, "amount": total},
+            ensure_ascii=False,
+        )
+        yield f"{separator}{item}"
+        separator = ","
+    yield "]"
+
+
+def _markdown_cell(value):
+    return str(value).replace("|", "\\|")
+
+
+def render_md(rows):
+    yield f"# {TITLE}\n\n"
+    yield "| Ингредиент | Количество | Единица |\n"
+    yield "| --- | ---: | --- |\n"
+    for name, unit, total in rows:
+        yield (
+            f"| {_markdown_cell(name)} | {total} "
+            f"| {_markdown_cell(unit)} |\n"
+        )
+
+
+EXPORT_FORMATS = {
+    "txt": (render_txt, "text/plain; charset=utf-8"),
+    "csv": (render_csv, "text/csv; charset=utf-8"),
+    "json": (render_json, "application/json; charset=utf-8"),
+    "md": (render_md, "text/markdown; charset=utf-8"),
+}
+
+
+def make_digest_key(user_id, export_format):
+    return f"shopping_list:digest:{user_id}:{export_format}"
+
+
+def make_artifact_key(digest, export_format):
+    return f"shopping_list:artifact:{export_format}:{digest}"
+
+
+def make_pending_key(user_id, export_format, stamp):
+    return f"shopping_list:pending:{user_id}:{export_format}:{stamp}"
+
+
+def _list_stamp(user_id):
+    (ingredients,) = redis_client.get_versions("ingredients")
+    return f"{get_list_version(user_id)}:{ingredients}"
+
+
+def cached_artifact(user_id, export_format):
+    stamp = _list_stamp(user_id)
+    entry = redis_client.redis.get(make_digest_key(user_id, export_format))
+    if entry is None:
+        return None
+    entry_stamp, _, digest = entry.rpartition("|")
+    if entry_stamp != stamp:
+        return None
+    return redis_client.redis.get(make_artifact_key(digest, export_format))
+
+
+def claim_build(user_id, export_format):
+    key = make_pending_key(user_id, export_format, _list_stamp(user_id))
+    task_id = str(uuid.uuid4())
+    while True:
+        if redis_client.redis.set(key, task_id, nx=True, ex=PENDING_TTL):
+            return task_id, True
+        pending = redis_client.redis.get(key)
+        if pending is not None:
+            return pending, False
+
+
+def build_artifact(user_id, export_format):
+    # Read the stamp first, so a change made while rendering wins.
+    stamp = _list_stamp(user_id)
+    rows = list(shopping_list_rows(user_id))
+    digest = hashlib.sha256(
+        json.dumps(rows, ensure_ascii=False).encode()
+    ).hexdigest()
+
+    artifact_key = make_artifact_key(digest, export_format)
+    if not redis_client.redis.expire(artifact_key, ARTIFACT_TTL):
+        render, _ = EXPORT_FORMATS[export_format]
+        redis_client.redis.set(
+            artifact_key, "".join(render(rows)), ex=ARTIFACT_TTL
+        )
+    redis_client.redis.set(
+        make_digest_key(user_id, export_format),
+        f"{stamp}|{digest}",
+        ex=ARTIFACT_TTL,
+    )
+    return digest
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.autocomplete import engine_cache
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from services.local_cache import local_cache
+from services.redis import redis_client
+from services.transactions import OnCommitBatch
+from users.models import Favourite, Follow, ShoppingCart
+
+
+USER_LIST_FIELDS = frozenset(
+    ("email", "username", "first_name", "last_name", "avatar")
+)
+RECIPE_COUNTERS = "recipe_counters"
+
+
+def _invalidate(tags=(), versions=()):
+    redis_client.bump_versions(*versions)
+    local_cache.invalidate_tags(tags)
+    engine_cache.invalidate_tags(tags)
+    redis_client.invalidate_tags(*tags)
+
+
+cache_invalidation = OnCommitBatch(_invalidate)
+
+
+def invalidate_on_commit(*tags, versions=()):
+    cache_invalidation.add(tags=tags, versions=versions)
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe_on_save(sender, instance, created, **kwargs):
+    # An edit can move the recipe into cached filtered pages it was not on.
+    invalidate_on_commit(
+        "recipes", f"recipe:{instance.pk}", versions=["recipes"]
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_on_delete(sender, instance, **kwargs):
+    invalidate_on_commit(
+        "recipes", f"recipe:{instance.pk}", versions=["recipes"]
+    )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_recipe_on_ingredient_row_change(sender, instance, **kwargs):
+    invalidate_on_commit(
+        f"recipe:{instance.recipe_id}", versions=["recipes"]
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_catalog(sender, instance, **kwargs):
+    invalidate_on_commit(
+        "ingredients", "recipes", versions=["ingredients", "recipes"]
+    )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_on_save(sender, instance, created, update_fields,
+                            **kwargs):
+    if created:
+        invalidate_on_commit("users")
+    elif update_fields is None or USER_LIST_FIELDS & update_fields:
+        invalidate_on_commit(f"user:{instance.pk}", versions=["recipes"])
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_on_delete(sender, instance, **kwargs):
+    invalidate_on_commit(
+        "users", f"user:{instance.pk}", versions=["recipes"]
+    )
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_delete, sender=Favourite)
+def invalidate_favourites(sender, instance, **kwargs):
+    invalidate_on_commit(
+        f"favourites:{instance.user_id}",
+        RECIPE_COUNTERS,
+        versions=[f"flags:{instance.user_id}", RECIPE_COUNTERS],
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def invalidate_cart(sender, instance, **kwargs):
+    invalidate_on_commit(
+        f"cart:{instance.user_id}",
+        RECIPE_COUNTERS,
+        versions=[f"flags:{instance.user_id}", RECIPE_COUNTERS],
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follows(sender, instance, **kwargs):
+    invalidate_on_commit(versions=[f"flags:{instance.user_id}"])
@@ -4,6 +4,8 @@ from services.redis import Redis
 import uuid
 from datetime import datetime
 
+from .shopping_list import build_artifact
+
 
 redis_client = Redis()
 
@@ -63,3 +65,7 @@ def get_cat_fact_task(count):
     redis_client.cache_set(cache_key, resp)
 
     return resp
+
+@shared_task
+def build_shopping_list_task(user_id, export_format):
+    return build_artifact(user_id, export_format)
@@ -1,37 +1,92 @@
-from django.db.models import Prefetch
-from django.http import HttpResponse
+import logging
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Exists, F, OuterRef, Prefetch, Q
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from .serializers import (
     IngredientSerializer,
+    RecipeIdsSerializer,
+    RecipeSearchSerializer,
     RecipeSerializer,
+    ShortUserSerializer,
     UserSerializer,
     FavoriteSerializer,
     SubscriptionSerializer,
     ShoppingCartSerializer,
     FollowCreateSerializer,
 )
-from recipes.models import Ingredient, Recipe
+from recipes.autocomplete import autocomplete_ingredients
+from recipes.facets import (
+    GLOBAL_SCOPE,
+    aggregate_facets,
+    author_scope,
+    read_facets,
+)
+from recipes.ingredient_index import match_recipes
+from recipes.search import RecipeSearch, SearchUnavailable
+from recipes.models import Ingredient, Recipe, RecipeIngredient
 from djoser.views import UserViewSet
 from users.models import User, Follow
-from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import (
     DjangoFilterBackend,
     FilterSet,
     CharFilter,
     BooleanFilter,
 )
+from .pagination import (
+    CustomPageNumberPagination,
+    KeysetPagination,
+    SubscriptionPagination,
+    UserSearchPagination,
+)
 from .permissions import IsAuthorOrReadOnly
-from users.models import Favourite
+from .negotiation import ExportContentNegotiation
+from .shopping_list import (
+    EXPORT_FORMATS,
+    cached_artifact,
+    claim_build,
+    shopping_list_rows,
+)
+from .signals import RECIPE_COUNTERS, invalidate_on_commit
+from users.models import Favourite, ShoppingCart
+from users.counters import COUNTER_FIELDS, adjust_counters
+from users.relations import link_recipes, unlink_recipes
+from users.shopping_list import (
+    add_to_shopping_list,
+    remove_from_shopping_list,
+)
 from rest_framework import filters
 from rabbitmq.producer import send_task
-from .tasks import get_quote_task, get_cat_fact_task
+from .tasks import (
+    build_shopping_list_task,
+    get_quote_task,
+    get_cat_fact_task,
+)
 from celery.result import AsyncResult
+from services.local_cache import local_cache
 from services.redis import redis_client
-from .mixins import CachedListMixin
+from .mixins import (
+    CachedListMixin,
+    ConditionalGetMixin,
+    QueryBudgetMixin,
+    RelationshipContextMixin,
+)
+
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+WHAT_TO_COOK_MAX_INGREDIENTS = 100
+FACETS_LIMIT = 10
+FACET_FILTER_PARAMS = ("name", "search", "is_favorited", "is_in_shopping_cart")
 
 
 class RecipeFilter(FilterSet):
@@ -39,6 +94,9 @@ class RecipeFilter(FilterSet):
         field_name="name",
         lookup_expr="icontains",
     )
+    search = CharFilter(
+        method="filter_search"
+    )
     is_favorited = BooleanFilter(
         method="filter_is_favorited"
     )
@@ -50,6 +108,14 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ["author"]
 
+    def filter_search(self, queryset, name, value):
+        query = SearchQuery(value, config="russian", search_type="websearch")
+        return queryset.filter(
+            search_vector=query
+        ).annotate(
+            search_rank=SearchRank(F("search_vector"), query)
+        ).order_by("-search_rank", "-created_at", "-id")
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if not user.is_authenticated:
@@ -71,6 +137,15 @@ class RecipeFilter(FilterSet):
         )
 
 
+class RecipeOrderingFilter(filters.OrderingFilter):
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not {"id", "-id"} & set(ordering):
+            ordering = [*ordering, "-id"]
+        return ordering
+
+
 class CustomFilter(FilterSet):
     name = CharFilter(
         field_name="name",
@@ -97,14 +172,8 @@ class UserFilter(FilterSet):
         fields = ["username"]
 
 
-class CustomPageNumberPagination(PageNumberPagination):
-    page_size = 6
-    page_size_query_param = "limit"
-    page_query_param = "page"
-    max_page_size = 100
-
-
 class IngredientViewSet(
+    ConditionalGetMixin,
     CachedListMixin,
     viewsets.ReadOnlyModelViewSet
 ):
@@ -116,11 +185,44 @@ class IngredientViewSet(
     permission_classes = (permissions.AllowAny,)
 
     cache_prefix = "ingredients"
-    cache_ttl = 3600
+    cache_ttl = 86400
+    cache_stale_ttl = 3600
+    cache_local = True
+
+    def get_list_version(self, request):
+        stamp = local_cache.get("version:ingredients")
+        if stamp is None:
+            (stamp,) = redis_client.get_versions("ingredients")
+            local_cache.set(
+                "version:ingredients",
+                stamp,
+                ttl=self.cache_local_ttl,
+                tags=["ingredients"],
+            )
+        return stamp, stamp
+
+    def get_detail_version(self, request):
+        return self.get_list_version(request)
+
+    @action(detail=False, methods=["get"])
+    def autocomplete(self, request):
+        raw = request.query_params.get("limit")
+        try:
+            limit = int(raw) if raw is not None else AUTOCOMPLETE_LIMIT
+        except (ValueError, TypeError):
+            limit = AUTOCOMPLETE_LIMIT
+        limit = min(max(limit, 1), AUTOCOMPLETE_MAX_LIMIT)
+
+        return Response(autocomplete_ingredients(
+            request.query_params.get("name", ""),
+            limit,
+        ))
 
 
 class PublicUserViewSet(
+    QueryBudgetMixin,
     CachedListMixin,
+    RelationshipContextMixin,
     UserViewSet
 ):
     pagination_class = CustomPageNumberPagination
@@ -128,10 +230,27 @@ class PublicUserViewSet(
     filterset_class = UserFilter
 
     cache_prefix = "users"
-    cache_ttl = 600
+    cache_ttl = 21600
+    query_budget = {
+        "list": 4,
+        "retrieve": 3,
+        "me": 3,
+        "subscriptions": 5,
+        "search": 2,
+    }
+
+    def get_cache_tags(self, items):
+        return [self.cache_prefix] + [f"user:{item['id']}" for item in items]
+
+    def apply_user_overlay(self, items):
+        relationships = self.get_relationships()
+        return [
+            {**item, "is_subscribed": relationships.is_subscribed(item["id"])}
+            for item in items
+        ]
 
     def get_queryset(self):
-        users = User.objects.all()
+        users = User.objects.order_by("id")
         return users
 
     def get_permissions(self):
@@ -168,10 +287,32 @@ class PublicUserViewSet(
                 request.user.save()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.AllowAny],
+        pagination_class=UserSearchPagination,
+    )
+    def search(self, request):
+        query = request.query_params.get("q", "").strip()
+        users = User.objects.none()
+        if query:
+            users = User.objects.filter(
+                Q(username__istartswith=query) | Q(email__istartswith=query)
+            ).only("id", "username", "avatar")
+
+        page = self.paginate_queryset(users)
+        serializer = ShortUserSerializer(
+            page,
+            many=True,
+            context={"request": request},
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False,
             methods=['get'],
             permission_classes=[permissions.IsAuthenticated],
-            pagination_class=CustomPageNumberPagination,)
+            pagination_class=SubscriptionPagination,)
     def subscriptions(self, request):
         raw = request.query_params.get("recipes_limit")
         try:
@@ -269,7 +410,10 @@ class PublicUserViewSet(
 
 
 class RecipeViewSet(
+    QueryBudgetMixin,
+    ConditionalGetMixin,
     CachedListMixin,
+    RelationshipContextMixin,
     viewsets.ModelViewSet
 ):
     queryset = Recipe.objects.all()
@@ -278,13 +422,141 @@ class RecipeViewSet(
         permissions.IsAuthenticatedOrReadOnly,
         IsAuthorOrReadOnly
     ]
-    filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
-    pagination_class = CustomPageNumberPagination
-    ordering_fields = ("-created_at",)
+    pagination_class = KeysetPagination
+    ordering_fields = ("created_at", "favorites_count", "in_carts_count")
 
     cache_prefix = "recipes"
-    cache_ttl = 300
+    cache_ttl = 21600
+    cache_user_params = ("is_favorited", "is_in_shopping_cart")
+    query_budget = {
+        "list": 6,
+        "retrieve": 5,
+        "what_to_cook": 4,
+        "facets": 5,
+        "search": 5,
+        "download_shopping_cart": 2,
+        "bulk_favorite": 9,
+        "bulk_shopping_cart": 9,
+    }
+
+    def orders_by_counters(self, request):
+        ordering = request.query_params.get("ordering", "")
+        return any(
+            field.strip().lstrip("-") in COUNTER_FIELDS.values()
+            for field in ordering.split(",")
+        )
+
+    def get_list_version(self, request):
+        user = request.user
+        names = ["recipes"]
+        if self.orders_by_counters(request):
+            names.append(RECIPE_COUNTERS)
+        if not user.is_authenticated:
+            stamps = redis_client.get_versions(*names)
+            return ":".join(map(str, stamps)), max(stamps)
+        stamps = redis_client.get_versions(*names, f"flags:{user.pk}")
+        return ":".join(map(str, [user.pk, *stamps])), max(stamps)
+
+    def get_detail_version(self, request):
+        user = request.user
+        try:
+            queryset = Recipe.objects.filter(pk=int(self.kwargs["pk"]))
+        except ValueError:
+            return None
+        fields = ["card__updated_at"]
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                favorited=Exists(
+                    Favourite.objects.filter(
+                        user=user, recipe=OuterRef("pk")
+                    )
+                ),
+                in_cart=Exists(
+                    ShoppingCart.objects.filter(
+                        user=user, recipe=OuterRef("pk")
+                    )
+                ),
+                subscribed=Exists(
+                    Follow.objects.filter(
+                        user=user, following=OuterRef("author")
+                    )
+                ),
+            )
+            fields += ["favorited", "in_cart", "subscribed"]
+
+        row = queryset.values_list(*fields).first()
+        if row is None or row[0] is None:
+            return None
+        updated_at, *flags = row
+        stamp = ":".join([updated_at.isoformat(), *map(str, flags)])
+        if user.is_authenticated:
+            return stamp, None
+        return stamp, updated_at.timestamp()
+
+    def get_cache_tags(self, items):
+        tags = {self.cache_prefix}
+        for item in items:
+            tags.add(f"recipe:{item['id']}")
+            tags.add(f"user:{item['author']['id']}")
+        user = self.request.user
+        params = self.request.query_params
+        if self.orders_by_counters(self.request):
+            tags.add(RECIPE_COUNTERS)
+        if user.is_authenticated:
+            if "is_favorited" in params:
+                tags.add(f"favourites:{user.pk}")
+            if "is_in_shopping_cart" in params:
+                tags.add(f"cart:{user.pk}")
+        return sorted(tags)
+
+    def apply_user_overlay(self, items):
+        relationships = self.get_relationships()
+        recipe_ids = [item["id"] for item in items]
+        favorited = relationships.favorited_ids(recipe_ids)
+        in_cart = relationships.in_cart_ids(recipe_ids)
+        return [
+            {
+                **item,
+                "author": {
+                    **item["author"],
+                    "is_subscribed": relationships.is_subscribed(
+                        item["author"]["id"]
+                    ),
+                },
+                "is_favorited": item["id"] in favorited,
+                "is_in_shopping_cart": item["id"] in in_cart,
+            }
+            for item in items
+        ]
+
+    def get_queryset(self):
+        queryset = super().get_queryset().defer("search_vector")
+        if self.action in ("list", "retrieve", "what_to_cook", "search"):
+            queryset = queryset.annotate(card_data=F("card__data"))
+        else:
+            queryset = queryset.select_related(
+                "author"
+            ).prefetch_related(
+                Prefetch(
+                    "recipe_ingredients",
+                    queryset=RecipeIngredient.objects.select_related(
+                        "ingredient"
+                    ).order_by("ingredient__name"),
+                )
+            )
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favourite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+        )
 
     @action(
         detail=True,
@@ -302,6 +574,132 @@ class RecipeViewSet(
         context["request"] = self.request
         return context
 
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="what-to-cook",
+        pagination_class=CustomPageNumberPagination,
+    )
+    def what_to_cook(self, request):
+        try:
+            ingredient_ids = {
+                int(value)
+                for raw in request.query_params.getlist("ingredients")
+                for value in raw.split(",")
+                if value.strip()
+            }
+        except ValueError:
+            return Response(
+                {"ingredients": "Ожидаются идентификаторы ингредиентов"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not ingredient_ids:
+            return Response(
+                {"ingredients": "Укажите хотя бы один ингредиент"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(ingredient_ids) > WHAT_TO_COOK_MAX_INGREDIENTS:
+            return Response(
+                {"ingredients": "Слишком много ингредиентов"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        matches = self.paginate_queryset(match_recipes(ingredient_ids))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        results = []
+        for recipe_id, coverage, missing in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            item = self.get_serializer(recipe).data
+            item["coverage"] = round(coverage, 4)
+            item["missing_ingredients"] = missing
+            results.append(item)
+        return self.get_paginated_response(results)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        pagination_class=CustomPageNumberPagination,
+    )
+    def search(self, request):
+        params = request.query_params
+        serializer = RecipeSearchSerializer(data={
+            **params.dict(),
+            "ingredients": [
+                value
+                for raw in params.getlist("ingredients")
+                for value in raw.split(",")
+                if value.strip()
+            ],
+        })
+        serializer.is_valid(raise_exception=True)
+        search = RecipeSearch(**serializer.validated_data)
+
+        try:
+            recipe_ids = self.paginate_queryset(search.results())
+        except SearchUnavailable as error:
+            logger.warning("Recipe search index unavailable: %s", error)
+            recipe_ids = self.paginate_queryset(search.queryset())
+
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        return self.get_paginated_response([
+            self.get_serializer(recipes[recipe_id]).data
+            for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ])
+
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        queryset = self.filter_queryset(Recipe.objects.all())
+        params = request.query_params
+        if any(param in params for param in FACET_FILTER_PARAMS):
+            buckets, authors, ingredients = aggregate_facets(
+                queryset, FACETS_LIMIT
+            )
+        else:
+            author = params.get("author")
+            scope = author_scope(int(author)) if author else GLOBAL_SCOPE
+            buckets, authors, ingredients = read_facets(scope, FACETS_LIMIT)
+
+        usernames = dict(
+            User.objects.filter(
+                id__in=[author_id for author_id, _ in authors]
+            ).values_list("id", "username")
+        )
+        ingredient_objects = Ingredient.objects.in_bulk(
+            [ingredient_id for ingredient_id, _ in ingredients]
+        )
+        return Response({
+            "cooking_time": [
+                {"range": label, "count": count}
+                for label, count in buckets.items()
+            ],
+            "authors": [
+                {
+                    "id": author_id,
+                    "username": usernames[author_id],
+                    "count": count,
+                }
+                for author_id, count in authors
+                if author_id in usernames
+            ],
+            "ingredients": [
+                {
+                    "id": ingredient_id,
+                    "name": ingredient_objects[ingredient_id].name,
+                    "measurement_unit": (
+                        ingredient_objects[ingredient_id].measurement_unit
+                    ),
+                    "count": count,
+                }
+                for ingredient_id, count in ingredients
+                if ingredient_id in ingredient_objects
+            ],
+        })
+
     @action(
         detail=True,
         methods=["post", "delete"],
@@ -321,7 +719,8 @@ class RecipeViewSet(
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            Favourite.objects.create(user=request.user, recipe=recipe)
+            with transaction.atomic():
+                Favourite.objects.create(user=request.user, recipe=recipe)
 
             serializer = FavoriteSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -348,9 +747,12 @@ class RecipeViewSet(
         recipe = get_object_or_404(Recipe, id=pk)
 
         if request.method == "POST":
-            cart_item, created = request.user.shopping_carts.get_or_create(
-                recipe=recipe,
-            )
+            with transaction.atomic():
+                cart_item, created = request.user.shopping_carts.get_or_create(
+                    recipe=recipe,
+                )
+                if created:
+                    add_to_shopping_list(request.user.pk, [recipe.pk])
 
             if not created:
                 return Response(
@@ -362,9 +764,12 @@ class RecipeViewSet(
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         else:
-            deleted_count, _ = request.user.shopping_carts.filter(
-                recipe=recipe
-            ).delete()
+            with transaction.atomic():
+                deleted_count, _ = request.user.shopping_carts.filter(
+                    recipe=recipe
+                ).delete()
+                if deleted_count:
+                    remove_from_shopping_list(request.user.pk, [recipe.pk])
 
             if deleted_count == 0:
                 return Response(
@@ -374,43 +779,121 @@ class RecipeViewSet(
 
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def _bulk_relation(self, request, model, tag, on_added=None,
+                       on_removed=None):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data["recipes"]))
+        user = request.user
+
+        existing = set(
+            Recipe.objects.filter(id__in=recipe_ids).values_list(
+                "id", flat=True
+            )
+        )
+
+        with transaction.atomic():
+            # Raw SQL skips the model signals, so side effects follow the
+            # rows this request actually wrote.
+            if request.method == "POST":
+                changed = link_recipes(model, user.pk, recipe_ids)
+                if changed:
+                    adjust_counters(model, changed, 1)
+                if changed and on_added is not None:
+                    on_added(user.pk, changed)
+                done, skipped = "added", "exists"
+            else:
+                changed = unlink_recipes(model, user.pk, existing)
+                if changed:
+                    adjust_counters(model, changed, -1)
+                if changed and on_removed is not None:
+                    on_removed(user.pk, changed)
+                done, skipped = "removed", "absent"
+            if changed:
+                invalidate_on_commit(
+                    f"{tag}:{user.pk}",
+                    RECIPE_COUNTERS,
+                    versions=[f"flags:{user.pk}", RECIPE_COUNTERS],
+                )
+
+        changed = set(changed)
+        return Response({
+            "results": [
+                {
+                    "id": recipe_id,
+                    "status": (
+                        "not_found" if recipe_id not in existing
+                        else done if recipe_id in changed
+                        else skipped
+                    ),
+                }
+                for recipe_id in recipe_ids
+            ]
+        })
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="favorite/bulk",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def bulk_favorite(self, request):
+        return self._bulk_relation(request, Favourite, "favourites")
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="shopping_cart/bulk",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def bulk_shopping_cart(self, request):
+        return self._bulk_relation(
+            request,
+            ShoppingCart,
+            "cart",
+            on_added=add_to_shopping_list,
+            on_removed=remove_from_shopping_list,
+        )
+
     @action(
         detail=False,
         methods=["get"],
         permission_classes=[
             permissions.IsAuthenticated,
         ],
+        renderer_classes=[JSONRenderer],
+        content_negotiation_class=ExportContentNegotiation,
     )
     def download_shopping_cart(self, request):
-        recipes = Recipe.objects.filter(
-            in_shopping_carts__user=request.user,
-        )
-
-        serializer = RecipeSerializer(recipes, many=True)
-        data = serializer.data
-
-        result = {}
-
-        for recipe in data:
-            for ingredient_data in recipe["ingredients"]:
-                name = ingredient_data["name"]
-                amount = ingredient_data["amount"]
-                unit = ingredient_data["measurement_unit"]
-
-                if name not in result:
-                    result[name] = [amount, unit]
-                else:
-                    result[name][0] += amount
-
-        file_content = "Список покупок:\n\n"
-        for key, value in result.items():
-            file_content += f"{key} - {value[0]} {value[1]}\n"
-
-        response = HttpResponse(
-            content=file_content, content_type="text/plain; charset=utf-8"
+        export_format = request.query_params.get("format", "txt")
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"format": "Неподдерживаемый формат"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        render, content_type = EXPORT_FORMATS[export_format]
+
+        if request.query_params.get("mode") == "async":
+            content = cached_artifact(request.user.pk, export_format)
+            if content is None:
+                task_id, created = claim_build(request.user.pk, export_format)
+                if created:
+                    build_shopping_list_task.apply_async(
+                        (request.user.pk, export_format), task_id=task_id
+                    )
+                return Response(
+                    {"task_id": task_id, "status": "queued"},
+                    status=status.HTTP_202_ACCEPTED,
+                )
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                render(shopping_list_rows(request.user.pk)),
+                content_type=content_type,
+            )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{export_format}"'
         )
-        response['Content-Disposition'] = ('attachment; '
-                                           'filename="shopping_list.txt"')
         return response
 
 
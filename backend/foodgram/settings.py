@@ -16,6 +16,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "django_filters",
     "rest_framework.authtoken",
@@ -23,6 +24,7 @@ INSTALLED_APPS = [
     "corsheaders",
     "users",
     "recipes",
+    "api.apps.ApiConfig",
     "services.apps.ServicesConfig",
     "ws",
     'django.contrib.sites',
@@ -126,6 +128,8 @@ DJOSER = {
 
 AUTH_USER_MODEL = "users.User"
 
+QUERY_BUDGET_RAISE = os.getenv("QUERY_BUDGET_RAISE", "False") == "True"
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.yandex.ru'
 EMAIL_PORT = 587
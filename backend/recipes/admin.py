@@ -1,4 +1,5 @@
 from django.contrib import admin
+from users.counters import COUNTER_FIELDS, recipe_update_fields
 from .models import Ingredient, Recipe, RecipeIngredient
 
 
@@ -23,7 +24,13 @@ class RecipeAdmin(admin.ModelAdmin):
         "name",
         "author__email",
     )
-    readonly_fields = ("get_favorite_count",)
+    readonly_fields = ("get_favorite_count", *COUNTER_FIELDS.values())
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=recipe_update_fields())
+        else:
+            obj.save()
 
     def get_favorite_count(self, obj):
         return obj.in_favourites.count()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RecipeConfig(AppConfig):
     name = "recipes"
     verbose_name = "Рецепты"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,161 @@
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from django.db.models import Count
+
+from services.local_cache import LocalCache
+from .models import Ingredient
+
+
+CACHE_KEY = "autocomplete:ingredients"
+CACHE_TTL = 600
+MIN_SIMILARITY = 0.3
+
+_build_lock = threading.Lock()
+# Kept apart from the response cache so request keys cannot evict it.
+engine_cache = LocalCache(maxsize=1)
+
+
+def _trigrams(text):
+    trigrams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        trigrams.update(
+            padded[index:index + 3] for index in range(len(padded) - 2)
+        )
+    return trigrams
+
+
+class IngredientAutocomplete:
+    def __init__(self, rows):
+        self.items = {}
+        names = []
+        words = []
+        self.trigram_index = {}
+        self.trigram_counts = {}
+
+        for ingredient_id, name, measurement_unit, popularity in rows:
+            normalized = name.lower()
+            self.items[ingredient_id] = (name, measurement_unit, popularity)
+            names.append((normalized, ingredient_id))
+            words.extend(
+                (word, ingredient_id) for word in normalized.split()[1:]
+            )
+            trigrams = _trigrams(normalized)
+            self.trigram_counts[ingredient_id] = len(trigrams)
+            for trigram in trigrams:
+                self.trigram_index.setdefault(trigram, []).append(
+                    ingredient_id
+                )
+
+        names.sort()
+        words.sort()
+        self.names = [name for name, _ in names]
+        self.name_ids = [ingredient_id for _, ingredient_id in names]
+        self.words = [word for word, _ in words]
+        self.word_ids = [ingredient_id for _, ingredient_id in words]
+
+    @classmethod
+    def from_database(cls):
+        rows = Ingredient.objects.annotate(
+            popularity=Count("recipeingredient")
+        ).values_list("id", "name", "measurement_unit", "popularity")
+        return cls(rows)
+
+    def search(self, query, limit):
+        query = " ".join(query.lower().split())
+        if not query:
+            return []
+
+        seen = set()
+        results = []
+        tiers = (
+            self._prefix_matches(self.names, self.name_ids, query),
+            self._prefix_matches(self.words, self.word_ids, query),
+        )
+        for tier in tiers:
+            for ingredient_id in self._by_popularity(tier):
+                if ingredient_id not in seen:
+                    seen.add(ingredient_id)
+                    results.append(ingredient_id)
+            if len(results) >= limit:
+                return self._render(results[:limit])
+
+        for ingredient_id in self._similar(query):
+            if ingredient_id not in seen:
+                results.append(ingredient_id)
+                if len(results) >= limit:
+                    break
+        return self._render(results)
+
+    def _prefix_matches(self, keys, ids, query):
+        matches = []
+        for index in range(bisect_left(keys, query), len(keys)):
+            if not keys[index].startswith(query):
+                break
+            matches.append(ids[index])
+        return matches
+
+    def _by_popularity(self, ingredient_ids):
+        return sorted(
+            ingredient_ids,
+            key=lambda ingredient_id: (
+                -self.items[ingredient_id][2],
+                self.items[ingredient_id][0],
+            ),
+        )
+
+    def _similar(self, query):
+        trigrams = _trigrams(query)
+        hits = Counter()
+        for trigram in trigrams:
+            hits.update(self.trigram_index.get(trigram, ()))
+
+        scored = []
+        for ingredient_id, common in hits.items():
+            union = len(trigrams) + self.trigram_counts[ingredient_id] - common
+            similarity = common / union
+            if similarity >= MIN_SIMILARITY:
+                scored.append((
+                    -similarity,
+                    -self.items[ingredient_id][2],
+                    self.items[ingredient_id][0],
+                    ingredient_id,
+                ))
+        scored.sort()
+        return [ingredient_id for *_, ingredient_id in scored]
+
+    def _render(self, ingredient_ids):
+        return [
+            {
+                "id": ingredient_id,
+                "name": self.items[ingredient_id][0],
+                "measurement_unit": self.items[ingredient_id][1],
+            }
+            for ingredient_id in ingredient_ids
+        ]
+
+
+def _search_database(query, limit):
+    return list(
+        Ingredient.objects.filter(
+            name__istartswith=query.strip()
+        ).order_by("name").values("id", "name", "measurement_unit")[:limit]
+    )
+
+
+def autocomplete_ingredients(query, limit):
+    engine = engine_cache.get(CACHE_KEY)
+    if engine is None:
+        if not _build_lock.acquire(blocking=False):
+            # Another thread is building the index right now.
+            return _search_database(query, limit)
+        try:
+            engine = IngredientAutocomplete.from_database()
+            engine_cache.set(
+                CACHE_KEY, engine, ttl=CACHE_TTL, tags=["ingredients"]
+            )
+        finally:
+            _build_lock.release()
+    return engine.search(query, limit)
@@ -0,0 +1,59 @@
+from django.db.models import Prefetch
+
+from .models import Recipe, RecipeCard, RecipeIngredient
+
+
+def _file_url(field):
+    return field.url if field else None
+
+
+def build_card(recipe):
+    author = recipe.author
+    return {
+        "id": recipe.id,
+        "author": {
+            "email": author.email,
+            "id": author.id,
+            "username": author.username,
+            "first_name": author.first_name,
+            "last_name": author.last_name,
+            "avatar": _file_url(author.avatar),
+        },
+        "name": recipe.name,
+        "image": _file_url(recipe.image),
+        "text": recipe.text,
+        "cooking_time": recipe.cooking_time,
+        "ingredients": [
+            {
+                "id": item.ingredient.id,
+                "name": item.ingredient.name,
+                "measurement_unit": item.ingredient.measurement_unit,
+                "amount": item.amount,
+            }
+            for item in recipe.recipe_ingredients.all()
+        ],
+    }
+
+
+def refresh_recipe_cards(recipe_ids):
+    recipes = Recipe.objects.filter(
+        id__in=recipe_ids
+    ).defer(
+        "search_vector"
+    ).select_related(
+        "author"
+    ).prefetch_related(
+        Prefetch(
+            "recipe_ingredients",
+            queryset=RecipeIngredient.objects.select_related(
+                "ingredient"
+            ).order_by("ingredient__name"),
+        )
+    )
+    RecipeCard.objects.bulk_create(
+        [RecipeCard(recipe=recipe, data=build_card(recipe))
+         for recipe in recipes],
+        update_conflicts=True,
+        unique_fields=["recipe"],
+        update_fields=["data", "updated_at"],
+    )
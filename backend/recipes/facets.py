@@ -0,0 +1,175 @@
+from django.db.models import Count, Q
+
+from services.redis import redis_client
+from .models import Recipe, RecipeIngredient
+
+
+FACETS_PREFIX = "facets"
+GLOBAL_SCOPE = "all"
+COOKING_TIME_BUCKETS = (
+    ("0-15", 0, 15),
+    ("16-30", 16, 30),
+    ("31-60", 31, 60),
+    ("61+", 61, None),
+)
+
+
+def cooking_time_bucket(cooking_time):
+    for label, low, high in COOKING_TIME_BUCKETS:
+        if cooking_time >= low and (high is None or cooking_time <= high):
+            return label
+    return COOKING_TIME_BUCKETS[0][0]
+
+
+def author_scope(author_id):
+    return f"author:{author_id}"
+
+
+def _facet_key(scope, facet):
+    return f"{FACETS_PREFIX}:{scope}:{facet}"
+
+
+def _recipe_key(recipe_id):
+    return f"{FACETS_PREFIX}:recipe:{recipe_id}"
+
+
+def _count(pipe, author_id, bucket, ingredient_ids, amount):
+    for scope in (GLOBAL_SCOPE, author_scope(author_id)):
+        pipe.hincrby(_facet_key(scope, "cooking_time"), bucket, amount)
+        for ingredient_id in ingredient_ids:
+            pipe.zincrby(
+                _facet_key(scope, "ingredients"), amount, ingredient_id
+            )
+    pipe.zincrby(_facet_key(GLOBAL_SCOPE, "authors"), amount, author_id)
+
+
+def _prune(pipe, author_ids):
+    keys = [_facet_key(GLOBAL_SCOPE, "authors")]
+    for author_id in author_ids:
+        for scope in (GLOBAL_SCOPE, author_scope(author_id)):
+            keys.append(_facet_key(scope, "ingredients"))
+    for key in keys:
+        pipe.zremrangebyscore(key, "-inf", 0)
+
+
+def record_recipe(recipe_id, state):
+    key = _recipe_key(recipe_id)
+
+    def apply(pipe):
+        previous = pipe.hgetall(key)
+        pipe.multi()
+        author_ids = set()
+        if previous:
+            author_ids.add(int(previous["author"]))
+            _count(
+                pipe,
+                int(previous["author"]),
+                previous["bucket"],
+                [int(value) for value in previous["ingredients"].split(",")
+                 if value],
+                -1,
+            )
+            pipe.delete(key)
+        if state is not None:
+            author_id, cooking_time, ingredient_ids = state
+            bucket = cooking_time_bucket(cooking_time)
+            author_ids.add(author_id)
+            _count(pipe, author_id, bucket, ingredient_ids, 1)
+            pipe.hset(key, mapping={
+                "author": author_id,
+                "bucket": bucket,
+                "ingredients": ",".join(map(str, ingredient_ids)),
+            })
+        _prune(pipe, author_ids)
+
+    redis_client.redis.transaction(apply, key)
+
+
+def _load_states(recipe_ids):
+    states = {
+        recipe_id: (author_id, cooking_time, [])
+        for recipe_id, author_id, cooking_time in Recipe.objects.filter(
+            id__in=recipe_ids
+        ).order_by().values_list("id", "author_id", "cooking_time")
+    }
+    rows = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by().values_list("recipe_id", "ingredient_id")
+    for recipe_id, ingredient_id in rows:
+        states[recipe_id][2].append(ingredient_id)
+    return states
+
+
+def refresh_recipe_facets(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    states = _load_states(recipe_ids)
+    for recipe_id in recipe_ids:
+        record_recipe(recipe_id, states.get(recipe_id))
+
+
+def forget_recipe(recipe_id):
+    record_recipe(recipe_id, None)
+
+
+def rebuild_facets(batch_size=500):
+    client = redis_client.redis
+    keys = list(client.scan_iter(match=f"{FACETS_PREFIX}:*", count=1000))
+    if keys:
+        client.delete(*keys)
+
+    recipe_ids = list(Recipe.objects.order_by("id").values_list(
+        "id", flat=True
+    ))
+    for start in range(0, len(recipe_ids), batch_size):
+        refresh_recipe_facets(recipe_ids[start:start + batch_size])
+    return len(recipe_ids)
+
+
+def _pairs(rows):
+    return [(int(member), int(score)) for member, score in rows]
+
+
+def read_facets(scope, limit):
+    pipe = redis_client.redis.pipeline(transaction=False)
+    pipe.hgetall(_facet_key(scope, "cooking_time"))
+    pipe.zrevrange(
+        _facet_key(scope, "ingredients"), 0, limit - 1, withscores=True
+    )
+    if scope == GLOBAL_SCOPE:
+        pipe.zrevrange(
+            _facet_key(scope, "authors"), 0, limit - 1, withscores=True
+        )
+        cooking_time, ingredients, authors = pipe.execute()
+        authors = _pairs(authors)
+    else:
+        cooking_time, ingredients = pipe.execute()
+        total = sum(int(count) for count in cooking_time.values())
+        author_id = int(scope.split(":", 1)[1])
+        authors = [(author_id, total)] if total else []
+
+    buckets = {
+        label: int(cooking_time.get(label, 0))
+        for label, _, _ in COOKING_TIME_BUCKETS
+    }
+    return buckets, authors, _pairs(ingredients)
+
+
+def aggregate_facets(queryset, limit):
+    queryset = queryset.order_by()
+    buckets = queryset.aggregate(**{
+        label: Count(
+            "id",
+            filter=Q(cooking_time__gte=low)
+            & (Q() if high is None else Q(cooking_time__lte=high)),
+        )
+        for label, low, high in COOKING_TIME_BUCKETS
+    })
+    authors = queryset.values_list("author").annotate(
+        count=Count("id")
+    ).order_by("-count", "author")[:limit]
+    ingredients = RecipeIngredient.objects.filter(
+        recipe__in=queryset.values("id")
+    ).values_list("ingredient").annotate(
+        count=Count("id")
+    ).order_by("-count", "ingredient")[:limit]
+    return buckets, list(authors), list(ingredients)
@@ -0,0 +1,111 @@
+from collections import Counter
+
+from services.redis import redis_client
+from .models import RecipeIngredient
+
+
+INDEX_PREFIX = "ingredient_index"
+SIZES_KEY = f"{INDEX_PREFIX}:sizes"
+
+
+def _ingredient_key(ingredient_id):
+    return f"{INDEX_PREFIX}:ingredient:{ingredient_id}"
+
+
+def _recipe_key(recipe_id):
+    return f"{INDEX_PREFIX}:recipe:{recipe_id}"
+
+
+def index_recipe(recipe_id, ingredient_ids):
+    client = redis_client.redis
+    current = set(ingredient_ids)
+    previous = {
+        int(ingredient_id)
+        for ingredient_id in client.smembers(_recipe_key(recipe_id))
+    }
+
+    pipe = client.pipeline()
+    for ingredient_id in previous - current:
+        pipe.srem(_ingredient_key(ingredient_id), recipe_id)
+    for ingredient_id in current - previous:
+        pipe.sadd(_ingredient_key(ingredient_id), recipe_id)
+    pipe.delete(_recipe_key(recipe_id))
+    if current:
+        pipe.sadd(_recipe_key(recipe_id), *current)
+        pipe.hset(SIZES_KEY, recipe_id, len(current))
+    else:
+        pipe.hdel(SIZES_KEY, recipe_id)
+    pipe.execute()
+
+
+def unindex_recipe(recipe_id):
+    index_recipe(recipe_id, ())
+
+
+def ingredient_recipe_ids(ingredient_id):
+    return [
+        int(recipe_id)
+        for recipe_id in redis_client.redis.smembers(
+            _ingredient_key(ingredient_id)
+        )
+    ]
+
+
+def refresh_recipe_index(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+    rows = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list("recipe_id", "ingredient_id")
+    for recipe_id, ingredient_id in rows:
+        ingredients[recipe_id].append(ingredient_id)
+    for recipe_id, ingredient_ids in ingredients.items():
+        index_recipe(recipe_id, ingredient_ids)
+
+
+def rebuild_index():
+    client = redis_client.redis
+    keys = list(client.scan_iter(match=f"{INDEX_PREFIX}:*", count=1000))
+    if keys:
+        client.delete(*keys)
+
+    recipes = {}
+    rows = RecipeIngredient.objects.order_by().values_list(
+        "recipe_id", "ingredient_id"
+    ).iterator(chunk_size=2000)
+    for recipe_id, ingredient_id in rows:
+        recipes.setdefault(recipe_id, set()).add(ingredient_id)
+
+    pipe = client.pipeline(transaction=False)
+    for recipe_id, ingredient_ids in recipes.items():
+        for ingredient_id in ingredient_ids:
+            pipe.sadd(_ingredient_key(ingredient_id), recipe_id)
+        pipe.sadd(_recipe_key(recipe_id), *ingredient_ids)
+        pipe.hset(SIZES_KEY, recipe_id, len(ingredient_ids))
+    pipe.execute()
+    return len(recipes)
+
+
+def match_recipes(ingredient_ids):
+    client = redis_client.redis
+    pipe = client.pipeline(transaction=False)
+    for ingredient_id in ingredient_ids:
+        pipe.smembers(_ingredient_key(ingredient_id))
+
+    matched = Counter()
+    for members in pipe.execute():
+        matched.update(int(recipe_id) for recipe_id in members)
+    if not matched:
+        return []
+
+    recipe_ids = list(matched)
+    sizes = client.hmget(SIZES_KEY, recipe_ids)
+    results = []
+    for recipe_id, size in zip(recipe_ids, sizes):
+        if size is None:
+            continue
+        size = int(size)
+        have = matched[recipe_id]
+        results.append((recipe_id, have / size, size - have))
+    results.sort(key=lambda item: (-item[1], item[2], -item[0]))
+    return results
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ingredient_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Пересобирает индекс рецептов по ингредиентам"
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(f"Рецептов проиндексировано: {count}")
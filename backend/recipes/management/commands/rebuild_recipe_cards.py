@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cards import refresh_recipe_cards
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Пересобирает карточки рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True))
+        for start in range(0, len(recipe_ids), batch_size):
+            refresh_recipe_cards(recipe_ids[start:start + batch_size])
+        self.stdout.write(f"Карточек пересобрано: {len(recipe_ids)}")
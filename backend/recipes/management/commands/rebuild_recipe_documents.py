@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.search import sync_recipe_documents
+from services.redis import redis_client
+
+
+class Command(BaseCommand):
+    help = "Пересобирает поисковые документы рецептов в Redis"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        redis_client.create_recipe_index()
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True))
+        for start in range(0, len(recipe_ids), batch_size):
+            sync_recipe_documents(recipe_ids[start:start + batch_size])
+        self.stdout.write(f"Документов записано: {len(recipe_ids)}")
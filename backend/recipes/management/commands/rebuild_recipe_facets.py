@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики фасетов рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = rebuild_facets(options["batch_size"])
+        self.stdout.write(f"Рецептов учтено: {count}")
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:01
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0011_alter_ingredient_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="recipeingredient",
+            options={
+                "ordering": ["recipe_id", "ingredient__name"],
+                "verbose_name": "рецепт и ингредиент",
+                "verbose_name_plural": "Рецепты и ингредиенты",
+            },
+        ),
+    ]
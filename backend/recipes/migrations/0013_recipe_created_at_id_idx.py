@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0012_recipeingredient_ordering"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-created_at", "-id"],
+                name="recipe_created_at_id_idx",
+            ),
+        ),
+    ]
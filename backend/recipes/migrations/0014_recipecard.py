@@ -0,0 +1,87 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _file_url(field):
+    return field.url if field else None
+
+
+def build_card(recipe):
+    author = recipe.author
+    return {
+        "id": recipe.id,
+        "author": {
+            "email": author.email,
+            "id": author.id,
+            "username": author.username,
+            "first_name": author.first_name,
+            "last_name": author.last_name,
+            "avatar": _file_url(author.avatar),
+        },
+        "name": recipe.name,
+        "image": _file_url(recipe.image),
+        "text": recipe.text,
+        "cooking_time": recipe.cooking_time,
+        "ingredients": [
+            {
+                "id": item.ingredient.id,
+                "name": item.ingredient.name,
+                "measurement_unit": item.ingredient.measurement_unit,
+                "amount": item.amount,
+            }
+            for item in recipe.recipe_ingredients.all()
+        ],
+    }
+
+
+def build_recipe_cards(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    RecipeCard = apps.get_model("recipes", "RecipeCard")
+    recipes = Recipe.objects.select_related("author").prefetch_related(
+        "recipe_ingredients__ingredient"
+    )
+    RecipeCard.objects.bulk_create(
+        RecipeCard(recipe=recipe, data=build_card(recipe))
+        for recipe in recipes.iterator(chunk_size=500)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0013_recipe_created_at_id_idx"),
+        ("users", "0003_user_avatar_user_is_subscribed_alter_user_username"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeCard",
+            fields=[
+                (
+                    "recipe",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="card",
+                        serialize=False,
+                        to="recipes.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                ("data", models.JSONField(verbose_name="Карточка")),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Время обновления"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "карточка рецепта",
+                "verbose_name_plural": "Карточки рецептов",
+            },
+        ),
+        migrations.RunPython(build_recipe_cards, migrations.RunPython.noop),
+    ]
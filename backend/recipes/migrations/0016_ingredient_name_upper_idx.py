@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:14
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0015_recipe_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ingredient",
+            index=models.Index(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper(
+                        django.db.models.functions.comparison.Cast(
+                            "name", output_field=models.TextField()
+                        )
+                    ),
+                    name="text_pattern_ops",
+                ),
+                name="ingredient_name_upper_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0016_ingredient_name_upper_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["author", "-created_at", "-id"],
+                name="recipe_author_created_at_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipeingredient",
+            index=models.Index(
+                fields=["recipe", "ingredient"],
+                include=("amount",),
+                name="recipeingredient_recipe_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+FILL_COUNTERS = """
+    UPDATE recipes_recipe AS recipe SET
+        favorites_count = (
+            SELECT COUNT(*) FROM users_favourite AS favourite
+            WHERE favourite.recipe_id = recipe.id
+        ),
+        in_carts_count = (
+            SELECT COUNT(*) FROM users_shoppingcart AS cart
+            WHERE cart.recipe_id = recipe.id
+        )
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0017_hot_lookup_indexes"),
+        ("users", "0011_shoppinglistitem"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="В избранном"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="in_carts_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="В списках покупок"
+            ),
+        ),
+        migrations.RunSQL(FILL_COUNTERS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-favorites_count", "-id"],
+                name="recipe_favorites_count_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-in_carts_count", "-id"],
+                name="recipe_in_carts_count_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0018_recipe_counters"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="recipeingredient",
+            options={
+                "ordering": ["recipe_id"],
+                "verbose_name": "рецепт и ингредиент",
+                "verbose_name_plural": "Рецепты и ингредиенты",
+            },
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models.functions import Cast, Upper
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -21,6 +24,15 @@ class Ingredient(models.Model):
         verbose_name = "ингредиент"
         verbose_name_plural = "Ингредиенты"
         ordering = ["name"]
+        indexes = [
+            models.Index(
+                OpClass(
+                    Upper(Cast("name", output_field=models.TextField())),
+                    name="text_pattern_ops",
+                ),
+                name="ingredient_name_upper_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -58,11 +70,50 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name="Время публикации",
     )
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("name", weight="A", config="russian")
+            + SearchVector("text", weight="B", config="russian")
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name="Поисковый вектор",
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="В избранном",
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="В списках покупок",
+    )
 
     class Meta:
         verbose_name = "рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"],
+                name="recipe_created_at_id_idx",
+            ),
+            models.Index(
+                fields=["author", "-created_at", "-id"],
+                name="recipe_author_created_at_idx",
+            ),
+            GinIndex(
+                fields=["search_vector"],
+                name="recipe_search_vector_idx",
+            ),
+            models.Index(
+                fields=["-favorites_count", "-id"],
+                name="recipe_favorites_count_idx",
+            ),
+            models.Index(
+                fields=["-in_carts_count", "-id"],
+                name="recipe_in_carts_count_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -88,7 +139,38 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = "рецепт и ингредиент"
         verbose_name_plural = "Рецепты и ингредиенты"
-        ordering = ["-recipe__created_at", "ingredient__name"]
+        ordering = ["recipe_id"]
+        indexes = [
+            models.Index(
+                fields=["recipe", "ingredient"],
+                include=["amount"],
+                name="recipeingredient_recipe_idx",
+            ),
+        ]
 
     def __str__(self):
         return f'{self.ingredient.name} for {self.recipe.name}'
+
+
+class RecipeCard(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="card",
+        verbose_name="Рецепт",
+    )
+    data = models.JSONField(
+        verbose_name="Карточка",
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Время обновления",
+    )
+
+    class Meta:
+        verbose_name = "карточка рецепта"
+        verbose_name_plural = "Карточки рецептов"
+
+    def __str__(self):
+        return f"Карточка {self.recipe_id}"
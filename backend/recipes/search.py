@@ -0,0 +1,163 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+from redis.exceptions import RedisError
+
+from services.redis import redis_client
+from services.transactions import OnCommitBatch
+from .models import Recipe, RecipeIngredient
+
+
+ORDERINGS = {
+    "cooking_time": ("cooking_time", True),
+    "-cooking_time": ("cooking_time", False),
+    "created_at": ("created_at", True),
+    "-created_at": ("created_at", False),
+}
+SPECIAL_CHARACTER = re.compile(r"([^\w\s])")
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+def build_documents(recipe_ids):
+    documents = {
+        recipe.id: {
+            "name": recipe.name,
+            "text": recipe.text,
+            "author": recipe.author_id,
+            "ingredients": "",
+            "cooking_time": recipe.cooking_time,
+            "created_at": recipe.created_at.timestamp(),
+        }
+        for recipe in Recipe.objects.filter(id__in=recipe_ids).only(
+            "id", "name", "text", "author_id", "cooking_time", "created_at"
+        ).order_by()
+    }
+    ingredients = {}
+    rows = RecipeIngredient.objects.filter(
+        recipe_id__in=documents
+    ).order_by().values_list("recipe_id", "ingredient_id")
+    for recipe_id, ingredient_id in rows:
+        ingredients.setdefault(recipe_id, []).append(str(ingredient_id))
+    for recipe_id, ingredient_ids in ingredients.items():
+        documents[recipe_id]["ingredients"] = ",".join(ingredient_ids)
+    return documents
+
+
+def sync_recipe_documents(recipe_ids):
+    recipe_ids = set(recipe_ids)
+    documents = build_documents(recipe_ids)
+    redis_client.save_recipe_documents(documents)
+    redis_client.delete_recipe_documents(*(recipe_ids - set(documents)))
+
+
+def _sync_documents(recipe_ids=()):
+    sync_recipe_documents(recipe_ids)
+
+
+document_sync = OnCommitBatch(_sync_documents)
+
+
+def sync_documents_on_commit(*recipe_ids):
+    document_sync.add(recipe_ids=recipe_ids)
+
+
+def _escape(text):
+    return " ".join(
+        SPECIAL_CHARACTER.sub(r"\\\1", word) for word in text.split()
+    )
+
+
+class RecipeSearch:
+    def __init__(self, q="", author=None, ingredients=(),
+                 cooking_time_min=None, cooking_time_max=None,
+                 ordering=None):
+        self.text = q.strip()
+        self.author = author
+        self.ingredients = sorted(set(ingredients))
+        self.cooking_time_min = cooking_time_min
+        self.cooking_time_max = cooking_time_max
+        if ordering is None and not self.text:
+            ordering = "-created_at"
+        self.ordering = ordering
+
+    def query_string(self):
+        parts = []
+        if self.text:
+            parts.append(f"({_escape(self.text)})")
+        if self.author is not None:
+            parts.append(f"@author:{{{self.author}}}")
+        for ingredient_id in self.ingredients:
+            parts.append(f"@ingredients:{{{ingredient_id}}}")
+        if (
+            self.cooking_time_min is not None
+            or self.cooking_time_max is not None
+        ):
+            low = self.cooking_time_min or "-inf"
+            high = self.cooking_time_max or "+inf"
+            parts.append(f"@cooking_time:[{low} {high}]")
+        return " ".join(parts) or "*"
+
+    def results(self):
+        return IndexedSearchResults(self)
+
+    def queryset(self):
+        queryset = Recipe.objects.all()
+        if self.text:
+            query = SearchQuery(
+                self.text, config="russian", search_type="websearch"
+            )
+            queryset = queryset.filter(search_vector=query).annotate(
+                search_rank=SearchRank(F("search_vector"), query)
+            )
+        if self.author is not None:
+            queryset = queryset.filter(author_id=self.author)
+        for ingredient_id in self.ingredients:
+            queryset = queryset.filter(
+                recipe_ingredients__ingredient_id=ingredient_id
+            )
+        if self.cooking_time_min is not None:
+            queryset = queryset.filter(
+                cooking_time__gte=self.cooking_time_min
+            )
+        if self.cooking_time_max is not None:
+            queryset = queryset.filter(
+                cooking_time__lte=self.cooking_time_max
+            )
+
+        if self.ordering is None:
+            ordering = ("-search_rank", "-created_at", "-id")
+        else:
+            ordering = (self.ordering, "-id")
+        return queryset.order_by(*ordering).values_list("id", flat=True)
+
+
+class IndexedSearchResults:
+    ordered = True
+
+    def __init__(self, search):
+        self.query_string = search.query_string()
+        self.sort_by, self.asc = ORDERINGS.get(search.ordering, (None, True))
+
+    def _search(self, offset, limit):
+        try:
+            return redis_client.search_recipes(
+                self.query_string,
+                sort_by=self.sort_by,
+                asc=self.asc,
+                offset=offset,
+                limit=limit,
+            )
+        except RedisError as error:
+            raise SearchUnavailable(str(error)) from error
+
+    def count(self):
+        total, _ = self._search(0, 0)
+        return total
+
+    def __getitem__(self, item):
+        _, recipe_ids = self._search(item.start, item.stop - item.start)
+        return recipe_ids
@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cards import refresh_recipe_cards
+from .facets import forget_recipe, refresh_recipe_facets
+from .ingredient_index import (
+    ingredient_recipe_ids,
+    refresh_recipe_index,
+    unindex_recipe,
+)
+from .models import Ingredient, Recipe, RecipeIngredient
+from .search import sync_documents_on_commit
+
+
+CARD_AUTHOR_FIELDS = frozenset(
+    ("email", "username", "first_name", "last_name", "avatar")
+)
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_card_on_recipe_save(sender, instance, created, raw, **kwargs):
+    # A new recipe gets its card once its ingredients are saved.
+    if raw or created:
+        return
+    refresh_recipe_cards([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def refresh_card_on_ingredient_row_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    refresh_recipe_cards([instance.recipe_id])
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_card_on_ingredient_row_delete(sender, instance, origin=None,
+                                          **kwargs):
+    # Rows cascading from a recipe or its author leave with the card.
+    if getattr(origin, "model", type(origin)) not in (
+        RecipeIngredient, Ingredient
+    ):
+        return
+    refresh_recipe_cards([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_cards_on_ingredient_save(sender, instance, created, raw,
+                                     **kwargs):
+    if raw or created:
+        return
+    refresh_recipe_cards(
+        Recipe.objects.filter(
+            recipe_ingredients__ingredient=instance
+        ).values("id")
+    )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def refresh_cards_on_author_save(sender, instance, created, raw,
+                                 update_fields, **kwargs):
+    if raw or created:
+        return
+    if update_fields is not None and not CARD_AUTHOR_FIELDS & update_fields:
+        return
+    refresh_recipe_cards(
+        Recipe.objects.filter(author=instance).values("id")
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_facets_on_recipe_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: refresh_recipe_facets([recipe_id]))
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe_on_delete(sender, instance, **kwargs):
+    recipe_id = instance.pk
+
+    def unindex():
+        unindex_recipe(recipe_id)
+        forget_recipe(recipe_id)
+
+    transaction.on_commit(unindex)
+
+
+@receiver(post_delete, sender=Ingredient)
+def reindex_recipes_on_ingredient_delete(sender, instance, **kwargs):
+    ingredient_id = instance.pk
+
+    def reindex():
+        recipe_ids = ingredient_recipe_ids(ingredient_id)
+        refresh_recipe_index(recipe_ids)
+        refresh_recipe_facets(recipe_ids)
+
+    transaction.on_commit(reindex)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def sync_document_on_recipe_change(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    sync_documents_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def sync_document_on_ingredient_row_change(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+    sync_documents_on_commit(instance.recipe_id)
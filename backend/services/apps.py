@@ -11,3 +11,4 @@ class ServicesConfig(AppConfig):
     def ready(self):
         redis = Redis()
         redis.create_index()
+        redis.create_recipe_index()
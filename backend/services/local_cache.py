@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires, _ = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, tags=()):
+        self._ensure_listener()
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl, set(tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_tags(self, tags):
+        tags = set(tags)
+        with self._lock:
+            for key in [
+                key for key, (_, _, entry_tags) in self._entries.items()
+                if entry_tags & tags
+            ]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _ensure_listener(self):
+        if self._listener is not None and self._listener.is_alive():
+            return
+        from services.redis import redis_client
+
+        self._listener = redis_client.subscribe_invalidations(
+            self.invalidate_tags,
+            self._on_listener_error,
+        )
+
+    def _on_listener_error(self, error, pubsub, thread):
+        # Messages may have been lost while disconnected.
+        self.clear()
+        time.sleep(1)
+
+
+local_cache = LocalCache()
@@ -1,17 +1,26 @@
 import sys
 import redis
 import json
+import time
+import uuid
 
 sys.path.insert(0, '/app')
 
 from services.vault_helper import vault_helper
-from redis.commands.search.field import TextField, TagField
+from redis.commands.search.field import NumericField, TextField, TagField
 from redis.commands.search.index_definition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+from redis.exceptions import WatchError
 
 
 class Redis:
     _client = None
     _vault_data = None
+    invalidation_channel = "cache:invalidate"
+    generation_key = "cache:generation"
+    tag_generation_ttl = 3600
+    recipe_index = "idx_recipes"
+    recipe_document_prefix = "recipe_doc:"
 
     def __init__(self):
         if Redis._client is None:
@@ -51,6 +60,51 @@ class Redis:
         except Exception as e:
             print("Index create skipped:", e)
 
+    def create_recipe_index(self):
+        try:
+            self.redis.ft(self.recipe_index).create_index(
+                fields=[
+                    TextField("name", weight=5.0),
+                    TextField("text"),
+                    TagField("author"),
+                    TagField("ingredients"),
+                    NumericField("cooking_time", sortable=True),
+                    NumericField("created_at", sortable=True),
+                ],
+                definition=IndexDefinition(
+                    prefix=[self.recipe_document_prefix],
+                    index_type=IndexType.HASH,
+                    language="russian",
+                )
+            )
+            print("Redis recipe index created")
+        except Exception as e:
+            print("Recipe index create skipped:", e)
+
+    def make_recipe_document_key(self, recipe_id):
+        return f"{self.recipe_document_prefix}{recipe_id}"
+
+    def save_recipe_documents(self, documents):
+        pipe = self.redis.pipeline()
+        for recipe_id, document in documents.items():
+            key = self.make_recipe_document_key(recipe_id)
+            pipe.delete(key)
+            pipe.hset(key, mapping=document)
+        pipe.execute()
+
+    def delete_recipe_documents(self, *recipe_ids):
+        if recipe_ids:
+            self.redis.delete(*map(self.make_recipe_document_key, recipe_ids))
+
+    def search_recipes(self, query_string, sort_by=None, asc=True,
+                       offset=0, limit=10):
+        query = Query(query_string).no_content().paging(offset, limit)
+        if sort_by:
+            query = query.sort_by(sort_by, asc=asc)
+        result = self.redis.ft(self.recipe_index).search(query)
+        prefix = len(self.recipe_document_prefix)
+        return result.total, [int(doc.id[prefix:]) for doc in result.docs]
+
     def make_cache_key(self, prefix, **params):
         parts = [prefix] + [f"{k}:{v}" for k, v in sorted(params.items())]
         return "|".join(parts)
@@ -61,8 +115,137 @@ class Redis:
             return json.loads(data)
         return None
 
-    def cache_set(self, key, value, ttl=86400):
-        self.redis.set(key, json.dumps(value), ex=ttl)
+    def _queue_cache_set(self, pipe, key, value, ttl, tags):
+        pipe.set(key, json.dumps(value), ex=ttl)
+        for tag in tags:
+            tag_key = self.make_tag_key(tag)
+            pipe.sadd(tag_key, key)
+            pipe.expire(tag_key, ttl, nx=True)
+            pipe.expire(tag_key, ttl, gt=True)
+
+    def cache_set(self, key, value, ttl=86400, tags=()):
+        pipe = self.redis.pipeline()
+        self._queue_cache_set(pipe, key, value, ttl, tags)
+        pipe.execute()
+
+    def cache_generation(self):
+        return int(self.redis.get(self.generation_key) or 0)
+
+    def make_tag_generation_key(self, tag):
+        return f"tag_generation:{tag}"
+
+    def cache_set_unless_invalidated(self, key, value, ttl, tags,
+                                     generation):
+        generation_keys = [self.make_tag_generation_key(tag) for tag in tags]
+        with self.redis.pipeline() as pipe:
+            try:
+                if generation_keys:
+                    pipe.watch(*generation_keys)
+                    if any(
+                        int(stamp) > generation
+                        for stamp in pipe.mget(generation_keys)
+                        if stamp is not None
+                    ):
+                        return False
+                pipe.multi()
+                self._queue_cache_set(pipe, key, value, ttl, tags)
+                pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    def cache_get_entry(self, key):
+        entry = self.cache_get(key)
+        if isinstance(entry, dict) and "value" in entry and "expires" in entry:
+            return entry
+        return None
+
+    def cache_set_entry(self, key, value, ttl, stale_ttl=0, delta=0.0,
+                        tags=(), generation=None):
+        entry = {
+            "value": value,
+            "expires": time.time() + ttl,
+            "delta": delta,
+            "tags": list(tags),
+        }
+        if generation is None:
+            self.cache_set(key, entry, ttl=ttl + stale_ttl, tags=tags)
+        elif not self.cache_set_unless_invalidated(
+            key, entry, ttl + stale_ttl, tags, generation
+        ):
+            return None
+        return entry
+
+    def acquire_lock(self, key, timeout):
+        token = uuid.uuid4().hex
+        if self.redis.set(f"lock:{key}", token, nx=True, ex=timeout):
+            return token
+        return None
+
+    def release_lock(self, key, token):
+        lock_key = f"lock:{key}"
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(lock_key)
+                if pipe.get(lock_key) == token:
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    pipe.execute()
+            except redis.WatchError:
+                pass
+
+    def make_tag_key(self, tag):
+        return f"tag:{tag}"
+
+    def invalidate_tags(self, *tags):
+        if not tags:
+            return
+        tag_keys = [self.make_tag_key(tag) for tag in tags]
+        # Entries built from reads older than this generation are dropped.
+        generation = self.redis.incr(self.generation_key)
+        pipe = self.redis.pipeline()
+        for tag in tags:
+            pipe.set(
+                self.make_tag_generation_key(tag),
+                generation,
+                ex=self.tag_generation_ttl,
+            )
+        pipe.sunion(tag_keys)
+        pipe.delete(*tag_keys)
+        *_, keys, _ = pipe.execute()
+        if keys:
+            self.redis.delete(*keys)
+        self.redis.publish(self.invalidation_channel, json.dumps(list(tags)))
+
+    def subscribe_invalidations(self, handler, exception_handler=None):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{
+            self.invalidation_channel:
+                lambda message: handler(json.loads(message["data"]))
+        })
+        return pubsub.run_in_thread(
+            sleep_time=1.0,
+            daemon=True,
+            exception_handler=exception_handler,
+        )
+
+    def make_version_key(self, name):
+        return f"version:{name}"
+
+    def bump_versions(self, *names, ttl=2592000):
+        now = time.time()
+        pipe = self.redis.pipeline()
+        for name in names:
+            pipe.set(self.make_version_key(name), now, ex=ttl)
+        pipe.execute()
 
+    def get_versions(self, *names, ttl=2592000):
+        keys = [self.make_version_key(name) for name in names]
+        now = time.time()
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.set(key, now, ex=ttl, nx=True)
+        pipe.mget(keys)
+        return [float(value) for value in pipe.execute()[-1]]
 
 redis_client = Redis()
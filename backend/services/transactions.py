@@ -0,0 +1,27 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+
+class OnCommitBatch:
+    def __init__(self, handler):
+        self.handler = handler
+        self._local = threading.local()
+
+    def add(self, **items):
+        pending = getattr(self._local, "pending", None)
+        if pending is None:
+            pending = self._local.pending = defaultdict(set)
+        for name, values in items.items():
+            pending[name].update(values)
+        # Only the first callback to run finds anything pending; items left
+        # by a rolled back transaction are flushed with the next commit.
+        transaction.on_commit(self.flush)
+
+    def flush(self):
+        pending = getattr(self._local, "pending", None)
+        if not pending:
+            return
+        self._local.pending = None
+        self.handler(**pending)
@@ -97,3 +97,8 @@ def recipe2(user1, ingredient2):
     )
 
     return recipe
+
+
+@pytest.fixture(autouse=True)
+def enforce_query_budget(settings):
+    settings.QUERY_BUDGET_RAISE = True
@@ -1,7 +1,23 @@
+import base64
+import json
 from http import HTTPStatus
+from django.core.management import call_command
 from django.urls import reverse
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.authtoken.models import Token
+from api import views
+from api.serializers import RecipeSerializer
+from api.tasks import build_shopping_list_task
+from recipes.autocomplete import engine_cache
+from recipes.facets import rebuild_facets
+from recipes.ingredient_index import rebuild_index
+from recipes.models import Ingredient, Recipe
+from recipes.search import RecipeSearch
+from users.models import ShoppingListItem
+from services.local_cache import local_cache
+from services.redis import redis_client
 
 
 @pytest.mark.parametrize(
@@ -103,4 +119,876 @@ def test_download_cart_for_auth(api_client, user1, recipe1):
     url = reverse('api:recipes-download-shopping-cart')
     response = api_client.get(url)
     assert response.status_code == HTTPStatus.OK
-    assert 'Список покупок' in response.content.decode('utf-8')
+    content = b''.join(response.streaming_content).decode('utf-8')
+    assert 'Список покупок' in content
+
+
+@pytest.mark.django_db
+def test_recipe_flags_for_auth(api_client, user1, recipe1, recipe2):
+    user1.favourites.create(recipe=recipe1)
+    user1.shopping_carts.create(recipe=recipe2)
+    token = Token.objects.create(user=user1)
+    api_client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    url = reverse('api:recipes-detail', kwargs={'pk': recipe1.pk})
+    response = api_client.get(url)
+    assert response.data['is_favorited'] is True
+    assert response.data['is_in_shopping_cart'] is False
+
+
+@pytest.mark.django_db
+def test_author_is_subscribed_for_follower(api_client, user1, recipe1):
+    user1.follower.create(following=recipe1.author)
+    token = Token.objects.create(user=user1)
+    api_client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    url = reverse('api:recipes-detail', kwargs={'pk': recipe1.pk})
+    response = api_client.get(url)
+    assert response.data['author']['is_subscribed'] is True
+
+
+@pytest.mark.django_db
+def test_recipe_detail_queries_do_not_grow(
+    api_client, user1, recipe1, ingredient3, django_assert_max_num_queries
+):
+    for _ in range(5):
+        recipe1.recipe_ingredients.create(ingredient=ingredient3, amount=1)
+    token = Token.objects.create(user=user1)
+    api_client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    url = reverse('api:recipes-detail', kwargs={'pk': recipe1.pk})
+    with django_assert_max_num_queries(5):
+        response = api_client.get(url)
+    assert len(response.data['ingredients']) == 7
+
+
+@pytest.mark.django_db
+def test_recipes_cursor_pagination(client, recipe1, recipe2):
+    url = reverse('api:recipes-list')
+    response = client.get(url, {'cursor': '', 'limit': 1})
+    assert response.status_code == HTTPStatus.OK
+    assert 'count' not in response.data
+    assert response.data['previous'] is None
+    first = response.data['results'][0]['id']
+
+    response = client.get(response.data['next'])
+    assert response.data['next'] is None
+    assert response.data['results'][0]['id'] != first
+
+    response = client.get(response.data['previous'])
+    assert response.data['results'][0]['id'] == first
+    assert response.data['previous'] is None
+
+
+@pytest.mark.django_db
+def test_recipes_cursor_follows_ordering(client, user1, recipe1, recipe2):
+    user1.favourites.create(recipe=recipe1)
+    url = reverse('api:recipes-list')
+    params = {'cursor': '', 'limit': 1, 'ordering': '-favorites_count'}
+    response = client.get(url, params)
+    assert response.data['results'][0]['id'] == recipe1.id
+
+    response = client.get(response.data['next'])
+    assert response.data['results'][0]['id'] == recipe2.id
+    assert response.data['next'] is None
+
+    response = client.get(response.data['previous'])
+    assert response.data['results'][0]['id'] == recipe1.id
+
+    response = client.get(url, {'cursor': '', 'search': 'борщ'})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.parametrize(
+    'values',
+    (
+        ['не дата', 1],
+        ['2025-01-01T00:00:00+00:00', 'abc'],
+        [{'a': 1}, 1],
+        ['2025-01-01T00:00:00+00:00', [1]],
+        [None, 1],
+    ),
+)
+@pytest.mark.django_db
+def test_recipes_cursor_with_bad_values(client, recipe1, values):
+    cursor = base64.urlsafe_b64encode(
+        json.dumps({'v': values, 'r': 0}).encode()
+    ).decode()
+    response = client.get(reverse('api:recipes-list'), {'cursor': cursor})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_recipe_card_follows_author_profile(client, recipe1, ingredient3):
+    author = recipe1.author
+    author.first_name = 'Пётр'
+    author.save()
+    recipe1.recipe_ingredients.create(ingredient=ingredient3, amount=5)
+
+    url = reverse('api:recipes-detail', kwargs={'pk': recipe1.pk})
+    response = client.get(url)
+    assert response.data['author']['first_name'] == 'Пётр'
+    assert len(response.data['ingredients']) == 3
+
+
+@pytest.mark.django_db
+def test_ingredient_rows_ordered_without_join(client, recipe1):
+    assert '"recipes_ingredient"' not in str(
+        recipe1.recipe_ingredients.all().query
+    )
+    response = client.get(
+        reverse('api:recipes-detail', kwargs={'pk': recipe1.pk})
+    )
+    assert [item['name'] for item in response.data['ingredients']] == [
+        'Морковь', 'Свекла'
+    ]
+
+
+@pytest.mark.django_db
+def test_recipe_card_drops_deleted_ingredients(
+    client, recipe1, recipe2, ingredient1, ingredient2
+):
+    recipe1.recipe_ingredients.filter(ingredient=ingredient1).delete()
+    url = reverse('api:recipes-detail', kwargs={'pk': recipe1.pk})
+    response = client.get(url)
+    assert [item['id'] for item in response.data['ingredients']] == [
+        ingredient2.id
+    ]
+
+    ingredient2.delete()
+    response = client.get(url)
+    assert response.data['ingredients'] == []
+
+    recipe2.delete()
+    assert not Recipe.objects.filter(pk=recipe2.pk).exists()
+
+
+@pytest.mark.django_db
+def test_cached_recipes_list_is_user_aware(client, api_client, user1, recipe1):
+    user1.favourites.create(recipe=recipe1)
+    url = reverse('api:recipes-list')
+    params = {'author': recipe1.author.id}
+
+    response = client.get(url, params)
+    assert response.data['results'][0]['is_favorited'] is False
+
+    token = Token.objects.create(user=user1)
+    api_client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    response = api_client.get(url, params)
+    assert response.data['results'][0]['is_favorited'] is True
+
+    response = client.get(url, params)
+    assert response.data['results'][0]['is_favorited'] is False
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_save_invalidates_cached_lists(client, recipe1):
+    url = reverse('api:recipes-list')
+    params = {'author': recipe1.author.id}
+    response = client.get(url, params)
+    assert response.data['results'][0]['name'] == 'Борщ'
+
+    recipe1.name = 'Щи'
+    recipe1.save()
+
+    response = client.get(url, params)
+    assert response.data['results'][0]['name'] == 'Щи'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_rename_invalidates_filtered_lists(client, recipe1):
+    url = reverse('api:recipes-list')
+    for params in ({'name': 'щи'}, {'search': 'щи'}):
+        response = client.get(url, params)
+        assert response.data['results'] == []
+
+    recipe1.name = 'Щи'
+    recipe1.save()
+
+    for params in ({'name': 'щи'}, {'search': 'щи'}):
+        response = client.get(url, params)
+        assert [
+            item['id'] for item in response.data['results']
+        ] == [recipe1.id]
+
+
+@pytest.mark.django_db
+def test_list_invalidated_during_build_is_not_cached(
+    client, monkeypatch, recipe1
+):
+    url = reverse('api:recipes-list')
+    params = {'author': recipe1.author.id}
+    cache_key = redis_client.make_cache_key('recipes', **params)
+    snapshot = redis_client.cache_generation
+
+    def invalidated_after_snapshot():
+        generation = snapshot()
+        redis_client.invalidate_tags(f'recipe:{recipe1.pk}')
+        return generation
+
+    monkeypatch.setattr(
+        redis_client, 'cache_generation', invalidated_after_snapshot
+    )
+    response = client.get(url, params)
+    assert response.data['count'] == 1
+    assert redis_client.cache_get_entry(cache_key) is None
+
+    monkeypatch.undo()
+    client.get(url, params)
+    assert redis_client.cache_get_entry(cache_key) is not None
+
+
+@pytest.mark.django_db
+def test_recipe_detail_not_modified(client, recipe1):
+    url = reverse('api:recipes-detail', kwargs={'pk': recipe1.pk})
+    response = client.get(url)
+    assert response.status_code == HTTPStatus.OK
+    etag = response['ETag']
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+    recipe1.name = 'Щи'
+    recipe1.save()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.django_db(transaction=True)
+def test_counter_ordered_list_follows_favorites(
+    client, api_client, user1, recipe1, recipe2
+):
+    url = reverse('api:recipes-list')
+    params = {'ordering': '-favorites_count'}
+    response = client.get(url, params)
+    assert [item['id'] for item in response.data['results']] == [
+        recipe2.id, recipe1.id
+    ]
+    etag = response['ETag']
+    response = client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+    api_client.force_authenticate(user1)
+    api_client.post(
+        reverse('api:recipes-favorite', kwargs={'pk': recipe1.pk})
+    )
+    response = client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+    assert [item['id'] for item in response.data['results']] == [
+        recipe1.id, recipe2.id
+    ]
+
+    api_client.delete(
+        reverse('api:recipes-bulk-favorite'),
+        {'recipes': [recipe1.id]},
+        format='json',
+    )
+    response = client.get(url, params)
+    assert [item['id'] for item in response.data['results']] == [
+        recipe2.id, recipe1.id
+    ]
+
+
+@pytest.mark.django_db
+def test_stale_list_served_while_refresh_is_locked(client, recipe1):
+    url = reverse('api:recipes-list')
+    params = {'author': recipe1.author.id}
+    cache_key = redis_client.make_cache_key('recipes', **params)
+    stale = {'count': 0, 'next': None, 'previous': None, 'results': []}
+    redis_client.cache_set_entry(cache_key, stale, ttl=-1, stale_ttl=60)
+    token = redis_client.acquire_lock(cache_key, timeout=10)
+
+    response = client.get(url, params)
+    assert response.data['count'] == 0
+
+    redis_client.release_lock(cache_key, token)
+    response = client.get(url, params)
+    assert response.data['count'] == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_ingredients_served_from_local_cache(client, ingredient1):
+    url = reverse('api:ingredients-list')
+    params = {'name': ingredient1.name}
+    response = client.get(url, params)
+    assert response.data[0]['measurement_unit'] == 'г'
+
+    cache_key = redis_client.make_cache_key('ingredients', **params)
+    redis_client.redis.delete(cache_key)
+    Ingredient.objects.filter(pk=ingredient1.pk).update(measurement_unit='мг')
+    response = client.get(url, params)
+    assert response.data[0]['measurement_unit'] == 'г'
+
+    ingredient1.measurement_unit = 'кг'
+    ingredient1.save()
+    response = client.get(url, params)
+    assert response.data[0]['measurement_unit'] == 'кг'
+
+
+@pytest.mark.django_db
+def test_recipes_full_text_search(client, recipe1, recipe2):
+    url = reverse('api:recipes-list')
+    response = client.get(url, {'search': 'борщи'})
+    assert [item['id'] for item in response.data['results']] == [recipe1.id]
+
+    response = client.get(url, {'search': 'ням', 'author': recipe1.author.id})
+    assert response.data['count'] == 0
+
+
+@pytest.mark.django_db
+def test_ingredient_autocomplete(
+    client, django_assert_num_queries, recipe1, recipe2, ingredient3
+):
+    engine_cache.clear()
+    url = reverse('api:ingredients-autocomplete')
+    response = client.get(url, {'name': 'МО'})
+    assert [item['name'] for item in response.data] == ['Морковь', 'Молоко']
+
+    response = client.get(url, {'name': 'морквь', 'limit': 1})
+    assert response.data == [{
+        'id': recipe2.ingredients.get().id,
+        'name': 'Морковь',
+        'measurement_unit': 'г',
+    }]
+
+    for index in range(local_cache.maxsize + 1):
+        client.get(reverse('api:ingredients-list'), {'name': f'м{index}'})
+    with django_assert_num_queries(0):
+        client.get(url, {'name': 'мол'})
+
+
+@pytest.mark.django_db
+def test_what_to_cook_ranks_by_coverage(
+    api_client, django_capture_on_commit_callbacks, user1, recipe1, recipe2,
+    ingredient1, ingredient2, ingredient3
+):
+    rebuild_index()
+    api_client.force_authenticate(user1)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.patch(
+            reverse('api:recipes-detail', kwargs={'pk': recipe2.pk}),
+            {'ingredients': [
+                {'id': ingredient2.id, 'amount': 5},
+                {'id': ingredient3.id, 'amount': 1},
+            ]},
+            format='json',
+        )
+    assert response.status_code == HTTPStatus.OK
+
+    response = api_client.get(
+        reverse('api:recipes-what-to-cook'),
+        {'ingredients': f'{ingredient1.id},{ingredient2.id}'},
+    )
+    assert [
+        (item['id'], item['coverage'], item['missing_ingredients'])
+        for item in response.data['results']
+    ] == [(recipe1.id, 1.0, 0), (recipe2.id, 0.5, 1)]
+
+
+@pytest.mark.django_db
+def test_recipe_facets(
+    api_client, django_capture_on_commit_callbacks, user1, recipe1, recipe2,
+    ingredient2
+):
+    rebuild_facets()
+    api_client.force_authenticate(user1)
+    with django_capture_on_commit_callbacks(execute=True):
+        api_client.patch(
+            reverse('api:recipes-detail', kwargs={'pk': recipe2.pk}),
+            {
+                'cooking_time': 45,
+                'ingredients': [{'id': ingredient2.id, 'amount': 5}],
+            },
+            format='json',
+        )
+
+    url = reverse('api:recipes-facets')
+    response = api_client.get(url)
+    assert response.data['cooking_time'] == [
+        {'range': '0-15', 'count': 0},
+        {'range': '16-30', 'count': 0},
+        {'range': '31-60', 'count': 2},
+        {'range': '61+', 'count': 0},
+    ]
+    assert response.data['ingredients'][0] == {
+        'id': ingredient2.id,
+        'name': 'Морковь',
+        'measurement_unit': 'г',
+        'count': 2,
+    }
+
+    response = api_client.get(url, {'author': user1.id})
+    assert response.data['authors'] == [
+        {'id': user1.id, 'username': 'user1', 'count': 1}
+    ]
+
+    api_client.post(
+        reverse('api:recipes-favorite', kwargs={'pk': recipe1.pk})
+    )
+    response = api_client.get(url, {'is_favorited': 1})
+    assert response.data['authors'] == [
+        {'id': recipe1.author.id, 'username': 'user2', 'count': 1}
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_search_documents_and_fallback(
+    client, recipe1, recipe2, ingredient1
+):
+    recipe1.cooking_time = 25
+    recipe1.save()
+    document = redis_client.redis.hgetall(
+        redis_client.make_recipe_document_key(recipe1.id)
+    )
+    assert document['name'] == 'Борщ'
+    assert document['cooking_time'] == '25'
+
+    search = RecipeSearch(
+        q='борщ-2', author=3, ingredients=[2, 1], cooking_time_max=30
+    )
+    assert search.query_string() == (
+        '(борщ\\-2) @author:{3} @ingredients:{1} @ingredients:{2} '
+        '@cooking_time:[-inf 30]'
+    )
+
+    response = client.get(reverse('api:recipes-search'), {
+        'ingredients': ingredient1.id,
+        'cooking_time_max': 30,
+    })
+    assert response.status_code == HTTPStatus.OK
+    assert [item['id'] for item in response.data['results']] == [recipe1.id]
+
+
+@pytest.mark.django_db
+def test_user_search_matches_username_and_email(client, user1, user2):
+    url = reverse('api:users-search')
+    response = client.get(url, {'q': 'USER'})
+    assert response.status_code == HTTPStatus.OK
+    assert response.data['results'] == [
+        {'id': user1.id, 'username': 'user1', 'avatar': None},
+        {'id': user2.id, 'username': 'user2', 'avatar': None},
+    ]
+
+    response = client.get(url, {'q': 'user2@', 'limit': 1})
+    assert [item['id'] for item in response.data['results']] == [user2.id]
+    assert response.data['next'] is None
+
+
+@pytest.mark.django_db
+def test_user_search_with_token(api_client, user1, user2):
+    token = Token.objects.create(user=user1)
+    api_client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    response = api_client.get(reverse('api:users-search'), {'q': 'user2'})
+    assert response.status_code == HTTPStatus.OK
+    assert [item['id'] for item in response.data['results']] == [user2.id]
+
+
+@pytest.mark.django_db
+def test_download_cart_sums_ingredients(api_client, user1, recipe1, recipe2):
+    api_client.force_authenticate(user1)
+    for recipe in (recipe1, recipe2):
+        api_client.post(
+            reverse('api:recipes-shopping-cart', kwargs={'pk': recipe.pk})
+        )
+    url = reverse('api:recipes-download-shopping-cart')
+    response = api_client.get(url)
+    assert b''.join(response.streaming_content).decode('utf-8') == (
+        'Список покупок:\n\n'
+        'Морковь - 30 г\n'
+        'Свекла - 10 г\n'
+    )
+
+    response = api_client.get(url, {'format': 'csv'})
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    assert b''.join(response.streaming_content).decode('utf-8') == (
+        'name,measurement_unit,amount\r\n'
+        'Морковь,г,30\r\n'
+        'Свекла,г,10\r\n'
+    )
+
+    response = api_client.get(url, {'format': 'json'})
+    assert json.loads(b''.join(response.streaming_content)) == [
+        {'name': 'Морковь', 'measurement_unit': 'г', 'amount': 30},
+        {'name': 'Свекла', 'measurement_unit': 'г', 'amount': 10},
+    ]
+
+    response = api_client.get(url, {'format': 'md'})
+    lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+    assert lines[-1] == '| Свекла | 10 | г |'
+
+    response = api_client.get(url, {'format': 'xlsx'})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'format': 'Неподдерживаемый формат'}
+
+
+@pytest.mark.django_db
+def test_shopping_list_aggregate_follows_cart(
+    api_client, user1, user2, recipe1, recipe2, ingredient2
+):
+    def totals(user):
+        return dict(user.shopping_list_items.values_list(
+            'ingredient__name', 'amount'
+        ))
+
+    api_client.force_authenticate(user2)
+    api_client.post(
+        reverse('api:recipes-shopping-cart', kwargs={'pk': recipe2.pk})
+    )
+    api_client.force_authenticate(user1)
+    for recipe in (recipe1, recipe2):
+        api_client.post(
+            reverse('api:recipes-shopping-cart', kwargs={'pk': recipe.pk})
+        )
+    assert totals(user1) == {'Свекла': 10, 'Морковь': 30}
+
+    api_client.patch(
+        reverse('api:recipes-detail', kwargs={'pk': recipe2.pk}),
+        {'ingredients': [{'id': ingredient2.id, 'amount': 15}]},
+        format='json',
+    )
+    assert totals(user1) == {'Свекла': 10, 'Морковь': 35}
+    assert totals(user2) == {'Морковь': 15}
+
+    api_client.delete(
+        reverse('api:recipes-shopping-cart', kwargs={'pk': recipe1.pk})
+    )
+    assert totals(user1) == {'Морковь': 15}
+
+    recipe2.delete()
+    assert not ShoppingListItem.objects.exists()
+    call_command('rebuild_shopping_lists', verify=True)
+
+
+@pytest.mark.django_db
+def test_shopping_list_prune_touches_only_changed_rows(
+    api_client, user1, user2, recipe1, ingredient1
+):
+    untouched = ShoppingListItem.objects.create(
+        user=user2, ingredient=ingredient1, amount=0
+    )
+    api_client.force_authenticate(user1)
+    api_client.post(
+        reverse('api:recipes-shopping-cart', kwargs={'pk': recipe1.pk})
+    )
+    recipe1.delete()
+
+    assert not user1.shopping_list_items.exists()
+    assert ShoppingListItem.objects.filter(pk=untouched.pk).exists()
+
+
+@pytest.mark.django_db
+def test_bulk_favorite_skips_recipe_deleted_mid_request(
+    api_client, monkeypatch, settings, user1, recipe1, recipe2
+):
+    settings.QUERY_BUDGET_RAISE = False
+    link_recipes = views.link_recipes
+
+    def delete_then_link(model, user_id, recipe_ids):
+        Recipe.objects.filter(pk=recipe2.pk).delete()
+        return link_recipes(model, user_id, recipe_ids)
+
+    monkeypatch.setattr(views, 'link_recipes', delete_then_link)
+    api_client.force_authenticate(user1)
+    response = api_client.post(
+        reverse('api:recipes-bulk-favorite'),
+        {'recipes': [recipe1.id, recipe2.id]},
+        format='json',
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.data['results'][0] == {
+        'id': recipe1.id, 'status': 'added'
+    }
+    assert list(
+        user1.favourites.values_list('recipe_id', flat=True)
+    ) == [recipe1.id]
+
+
+@pytest.mark.django_db
+def test_bulk_cart_and_favorites(api_client, user1, recipe1, recipe2):
+    api_client.force_authenticate(user1)
+    user1.favourites.create(recipe=recipe1)
+    url = reverse('api:recipes-bulk-favorite')
+    response = api_client.post(
+        url, {'recipes': [recipe1.id, recipe2.id, 999999]}, format='json'
+    )
+    assert response.data['results'] == [
+        {'id': recipe1.id, 'status': 'exists'},
+        {'id': recipe2.id, 'status': 'added'},
+        {'id': 999999, 'status': 'not_found'},
+    ]
+    assert user1.favourites.count() == 2
+
+    url = reverse('api:recipes-bulk-shopping-cart')
+    api_client.post(url, {'recipes': [recipe1.id, recipe2.id]}, format='json')
+    assert dict(user1.shopping_list_items.values_list(
+        'ingredient__name', 'amount'
+    )) == {'Свекла': 10, 'Морковь': 30}
+
+    response = api_client.delete(url, {'recipes': [recipe2.id]}, format='json')
+    assert response.data['results'] == [{'id': recipe2.id, 'status': 'removed'}]
+    assert list(
+        user1.shopping_carts.values_list('recipe_id', flat=True)
+    ) == [recipe1.id]
+    assert dict(user1.shopping_list_items.values_list(
+        'ingredient__name', 'amount'
+    )) == {'Свекла': 10, 'Морковь': 20}
+
+    response = api_client.delete(url, {'recipes': [recipe2.id]}, format='json')
+    assert response.data['results'] == [{'id': recipe2.id, 'status': 'absent'}]
+    response = api_client.post(url, {'recipes': [recipe1.id]}, format='json')
+    assert response.data['results'] == [{'id': recipe1.id, 'status': 'exists'}]
+    assert dict(user1.shopping_list_items.values_list(
+        'ingredient__name', 'amount'
+    )) == {'Свекла': 10, 'Морковь': 20}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_shopping_list_served_from_artifact(
+    api_client, monkeypatch, django_assert_num_queries, user1, recipe1,
+    recipe2
+):
+    monkeypatch.setattr(
+        build_shopping_list_task,
+        'apply_async',
+        lambda args, task_id: build_shopping_list_task.apply(
+            args=args, task_id=task_id
+        ),
+    )
+    api_client.force_authenticate(user1)
+    cart_url = reverse('api:recipes-bulk-shopping-cart')
+    api_client.post(cart_url, {'recipes': [recipe1.id]}, format='json')
+
+    url = reverse('api:recipes-download-shopping-cart')
+    params = {'mode': 'async'}
+    response = api_client.get(url, params)
+    assert response.status_code == HTTPStatus.ACCEPTED
+
+    with django_assert_num_queries(0):
+        response = api_client.get(url, params)
+    assert response.content.decode('utf-8') == (
+        'Список покупок:\n\n'
+        'Морковь - 20 г\n'
+        'Свекла - 10 г\n'
+    )
+
+    api_client.post(cart_url, {'recipes': [recipe2.id]}, format='json')
+    response = api_client.get(url, params)
+    assert response.status_code == HTTPStatus.ACCEPTED
+    response = api_client.get(url, params)
+    assert 'Морковь - 30 г' in response.content.decode('utf-8')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_shopping_list_enqueued_once_per_list_version(
+    api_client, monkeypatch, user1, recipe1, recipe2
+):
+    queued = []
+    monkeypatch.setattr(
+        build_shopping_list_task,
+        'apply_async',
+        lambda args, task_id: queued.append(task_id),
+    )
+    api_client.force_authenticate(user1)
+    cart_url = reverse('api:recipes-bulk-shopping-cart')
+    api_client.post(cart_url, {'recipes': [recipe1.id]}, format='json')
+
+    url = reverse('api:recipes-download-shopping-cart')
+    params = {'mode': 'async'}
+    task_ids = [
+        api_client.get(url, params).data['task_id'] for _ in range(3)
+    ]
+    assert task_ids == queued * 3
+
+    response = api_client.get(url, {**params, 'format': 'csv'})
+    assert response.data['task_id'] == queued[1]
+
+    api_client.post(cart_url, {'recipes': [recipe2.id]}, format='json')
+    response = api_client.get(url, params)
+    assert response.data['task_id'] == queued[2]
+    assert len(set(queued)) == 3
+
+
+@pytest.mark.django_db
+def test_recipe_update_writes_only_changed_ingredients(
+    api_client, user2, recipe1, ingredient1, ingredient2, ingredient3
+):
+    def rows():
+        return {
+            row.ingredient_id: (row.pk, row.amount)
+            for row in recipe1.recipe_ingredients.all()
+        }
+
+    before = rows()
+    url = reverse('api:recipes-detail', kwargs={'pk': recipe1.pk})
+    api_client.force_authenticate(user2)
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.patch(url, {
+            'name': 'Борщ красный',
+            'ingredients': [
+                {'id': ingredient1.id, 'amount': 10},
+                {'id': ingredient2.id, 'amount': 20},
+            ],
+        }, format='json')
+    assert response.status_code == HTTPStatus.OK
+    assert rows() == before
+    statements = [query['sql'] for query in context.captured_queries]
+    lock = next(
+        index for index, sql in enumerate(statements)
+        if sql.startswith('SELECT') and sql.endswith('FOR UPDATE')
+        and 'FROM "recipes_recipe" ' in sql
+    )
+    assert 'FROM "recipes_recipeingredient"' in statements[lock + 1]
+    assert not [
+        query for query in context.captured_queries
+        if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        and 'recipes_recipeingredient' in query['sql'].split('(')[0]
+    ]
+
+    response = api_client.patch(url, {'ingredients': [
+        {'id': ingredient1.id, 'amount': 25},
+        {'id': ingredient3.id, 'amount': 5},
+    ]}, format='json')
+    assert response.status_code == HTTPStatus.OK
+    after = rows()
+    assert after[ingredient1.id] == (before[ingredient1.id][0], 25)
+    assert after[ingredient3.id][1] == 5
+    assert ingredient2.id not in after
+    assert [
+        (item['name'], item['amount'])
+        for item in response.data['ingredients']
+    ] == [('Молоко', 5), ('Свекла', 25)]
+
+
+@pytest.mark.django_db
+def test_recipe_update_drops_duplicate_ingredient_rows(
+    api_client, user1, user2, recipe1, ingredient1, ingredient2
+):
+    recipe1.recipe_ingredients.create(ingredient=ingredient1, amount=7)
+    api_client.force_authenticate(user1)
+    api_client.post(
+        reverse('api:recipes-bulk-shopping-cart'),
+        {'recipes': [recipe1.id]},
+        format='json',
+    )
+    assert ShoppingListItem.objects.get(
+        user=user1, ingredient=ingredient1
+    ).amount == 17
+
+    api_client.force_authenticate(user2)
+    response = api_client.patch(
+        reverse('api:recipes-detail', kwargs={'pk': recipe1.pk}),
+        {'ingredients': [
+            {'id': ingredient1.id, 'amount': 10},
+            {'id': ingredient2.id, 'amount': 20},
+        ]},
+        format='json',
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert sorted(
+        recipe1.recipe_ingredients.values_list('ingredient_id', 'amount')
+    ) == [(ingredient1.id, 10), (ingredient2.id, 20)]
+    assert sorted(
+        ShoppingListItem.objects.filter(user=user1).values_list(
+            'ingredient_id', 'amount'
+        )
+    ) == [(ingredient1.id, 10), (ingredient2.id, 20)]
+
+
+@pytest.mark.django_db
+def test_recipe_ingredients_validated_in_one_query(
+    django_assert_num_queries, recipe1, ingredient1, ingredient2, ingredient3
+):
+    payload = [
+        {'id': ingredient.id, 'amount': 5}
+        for ingredient in (ingredient1, ingredient2, ingredient3)
+    ]
+    serializer = RecipeSerializer(
+        recipe1, data={'ingredients': payload}, partial=True
+    )
+    with django_assert_num_queries(1):
+        assert serializer.is_valid(), serializer.errors
+    assert [
+        item['ingredient'] for item in serializer.validated_data['ingredients']
+    ] == [ingredient1, ingredient2, ingredient3]
+
+    missing_id = ingredient3.id + 100
+    serializer = RecipeSerializer(recipe1, data={'ingredients': [
+        {'id': ingredient1.id, 'amount': 5},
+        {'id': missing_id, 'amount': 5},
+        {'id': ingredient1.id, 'amount': 7},
+    ]}, partial=True)
+    with django_assert_num_queries(1):
+        assert not serializer.is_valid()
+    assert serializer.errors['ingredients'] == [
+        f'Ингредиенты не найдены: {missing_id}',
+        f'Обнаружены дубликаты ингредиентов: {ingredient1.id}',
+    ]
+
+
+@pytest.mark.django_db
+def test_recipe_counters_follow_favorites_and_carts(
+    api_client, client, user1, user2, recipe1, recipe2
+):
+    def counters(recipe):
+        recipe.refresh_from_db()
+        return recipe.favorites_count, recipe.in_carts_count
+
+    api_client.force_authenticate(user1)
+    api_client.post(
+        reverse('api:recipes-favorite', kwargs={'pk': recipe1.pk})
+    )
+    api_client.post(
+        reverse('api:recipes-shopping-cart', kwargs={'pk': recipe1.pk})
+    )
+    api_client.post(
+        reverse('api:recipes-bulk-favorite'),
+        {'recipes': [recipe1.id, recipe2.id]},
+        format='json',
+    )
+    api_client.force_authenticate(user2)
+    api_client.post(
+        reverse('api:recipes-bulk-shopping-cart'),
+        {'recipes': [recipe1.id, recipe2.id]},
+        format='json',
+    )
+    api_client.post(
+        reverse('api:recipes-favorite', kwargs={'pk': recipe2.pk})
+    )
+    assert counters(recipe1) == (1, 2)
+    assert counters(recipe2) == (2, 1)
+    for ordering, expected in (
+        ('-favorites_count', [recipe2.id, recipe1.id]),
+        ('-in_carts_count', [recipe1.id, recipe2.id]),
+    ):
+        response = client.get(
+            reverse('api:recipes-list'), {'ordering': ordering}
+        )
+        assert [
+            item['id'] for item in response.data['results']
+        ] == expected
+
+    stale = Recipe.objects.get(pk=recipe2.pk)
+    api_client.delete(
+        reverse('api:recipes-shopping-cart', kwargs={'pk': recipe1.pk})
+    )
+    api_client.delete(
+        reverse('api:recipes-bulk-favorite'),
+        {'recipes': [recipe2.id]},
+        format='json',
+    )
+    serializer = RecipeSerializer(stale, data={
+        'name': 'Морковь по-домашнему',
+        'ingredients': [
+            {'id': row.ingredient_id, 'amount': row.amount}
+            for row in stale.recipe_ingredients.all()
+        ],
+    }, partial=True)
+    assert serializer.is_valid(), serializer.errors
+    serializer.save()
+    assert counters(recipe1) == (1, 1)
+    assert counters(recipe2) == (1, 1)
+
+    user1.delete()
+    assert counters(recipe1) == (0, 0)
+    user2.favourites.create(recipe=recipe1)
+    assert counters(recipe1) == (1, 0)
+    user2.favourites.filter(recipe=recipe1).delete()
+    assert counters(recipe1) == (0, 0)
+    call_command('rebuild_recipe_counters', verify=True)
@@ -0,0 +1,190 @@
+import random
+import re
+
+import pytest
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from recipes.cards import refresh_recipe_cards
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from users.counters import rebuild_counters
+from users.models import Favourite, Follow, ShoppingCart, User
+from users.shopping_list import rebuild_shopping_lists
+
+
+SERVER_SIDE_CURSOR = re.compile(r'^DECLARE .+? CURSOR .*?FOR ')
+
+
+@pytest.fixture
+def seeded_data():
+    rng = random.Random(14)
+    users = User.objects.bulk_create(
+        User(
+            username=f'seed{index}',
+            email=f'seed{index}@example.com',
+            first_name='Seed',
+            last_name='User',
+        )
+        for index in range(50)
+    )
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+        for index in range(200)
+    )
+    recipes = Recipe.objects.bulk_create(
+        Recipe(
+            author=users[index % len(users)],
+            name=f'Рецепт {index}',
+            image='recipes/seed.jpg',
+            text='Описание',
+            cooking_time=rng.randint(1, 120),
+        )
+        for index in range(1000)
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+        for recipe in recipes
+        for ingredient in rng.sample(ingredients, 5)
+    )
+    refresh_recipe_cards([recipe.pk for recipe in recipes])
+    for model in (Favourite, ShoppingCart):
+        model.objects.bulk_create(
+            model(user=user, recipe=recipe)
+            for user in users
+            for recipe in rng.sample(recipes, 20)
+        )
+    rebuild_shopping_lists()
+    rebuild_counters()
+    Follow.objects.bulk_create(
+        Follow(user=user, following=following)
+        for user in users
+        for following in rng.sample(users, 10)
+        if following != user
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM ANALYZE')
+    return users[0]
+
+
+def explain_captured(api_client, user, url, params=None):
+    api_client.force_authenticate(user)
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(url, params)
+        if response.streaming:
+            b''.join(response.streaming_content)
+    assert response.status_code == 200
+
+    plans = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        for query in context.captured_queries:
+            sql = SERVER_SIDE_CURSOR.sub('', query['sql'])
+            if not sql.startswith('SELECT'):
+                continue
+            cursor.execute(f'EXPLAIN {sql}')
+            plans.append('\n'.join(row[0] for row in cursor.fetchall()))
+    assert plans
+    return plans
+
+
+def assert_plans_use(plans, *expected):
+    plan = '\n'.join(plans)
+    assert 'Seq Scan' not in plan, plan
+    for scan in expected:
+        assert scan in plan, plan
+
+
+FLAG_SCANS = (
+    'Index Only Scan using unique_user_favourite on users_favourite',
+    'Index Only Scan using unique_user_recipe on users_shoppingcart',
+)
+
+
+@pytest.mark.parametrize(
+    'params, expected',
+    (
+        (
+            {'author': None},
+            (
+                'Index Scan using recipe_author_created_at_idx',
+                'Index Only Scan using recipe_author_created_at_idx',
+            ),
+        ),
+        ({'is_favorited': 1}, ()),
+        ({'is_in_shopping_cart': 1}, ()),
+        (
+            {'is_favorited': 0, 'author': None},
+            ('Index Scan using recipe_author_created_at_idx',),
+        ),
+        (
+            {'ordering': '-favorites_count'},
+            ('Index Scan using recipe_favorites_count_idx',),
+        ),
+        (
+            {'ordering': '-in_carts_count'},
+            ('Index Scan using recipe_in_carts_count_idx',),
+        ),
+    ),
+)
+@pytest.mark.django_db(transaction=True)
+def test_recipe_filter_plans_use_indexes(
+    api_client, seeded_data, params, expected
+):
+    params = {
+        key: seeded_data.id if value is None else value
+        for key, value in params.items()
+    }
+    plans = explain_captured(
+        api_client, seeded_data, reverse('api:recipes-list'), params
+    )
+    assert_plans_use(
+        plans,
+        'Index Only Scan using unique_user_following on users_follow',
+        *FLAG_SCANS,
+        *expected,
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_subscriptions_plans_use_indexes(api_client, seeded_data):
+    plans = explain_captured(
+        api_client,
+        seeded_data,
+        reverse('api:users-subscriptions'),
+        {'recipes_limit': 3},
+    )
+    assert_plans_use(
+        plans,
+        'Index Only Scan using unique_user_following on users_follow',
+        'Bitmap Index Scan on recipes_recipe_author_id_7274f74b',
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_download_shopping_cart_plans_use_indexes(api_client, seeded_data):
+    plans = explain_captured(
+        api_client,
+        seeded_data,
+        reverse('api:recipes-download-shopping-cart'),
+    )
+    assert_plans_use(
+        plans,
+        'Bitmap Index Scan on users_shoppinglistitem_user_id_f3b871a0',
+        'Index Scan using recipes_ingredient_pkey on recipes_ingredient',
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_user_search_plans_use_indexes(api_client, seeded_data):
+    plans = explain_captured(
+        api_client,
+        seeded_data,
+        reverse('api:users-search'),
+        {'q': 'Seed49'},
+    )
+    assert_plans_use(
+        plans,
+        'Bitmap Index Scan on user_username_upper_idx',
+        'Bitmap Index Scan on user_email_upper_idx',
+    )
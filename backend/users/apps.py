@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     name = "users"
     verbose_name = "Пользователи"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,57 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Recipe
+from .models import Favourite, ShoppingCart
+
+
+COUNTER_FIELDS = {
+    Favourite: "favorites_count",
+    ShoppingCart: "in_carts_count",
+}
+
+
+def adjust_counters(model, recipe_ids, amount):
+    field = COUNTER_FIELDS[model]
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        **{field: F(field) + amount}
+    )
+
+
+def recipe_update_fields():
+    counters = set(COUNTER_FIELDS.values())
+    return [
+        field.name for field in Recipe._meta.concrete_fields
+        if not field.primary_key and not field.generated
+        and field.name not in counters
+    ]
+
+
+def _expected(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef("pk")).order_by().values(
+                "recipe"
+            ).annotate(total=Count("id")).values("total")
+        ),
+        Value(0),
+    )
+
+
+def rebuild_counters():
+    return Recipe.objects.update(**{
+        field: _expected(model) for model, field in COUNTER_FIELDS.items()
+    })
+
+
+def find_mismatches():
+    mismatches = []
+    for model, field in COUNTER_FIELDS.items():
+        rows = Recipe.objects.annotate(expected=_expected(model)).exclude(
+            **{field: F("expected")}
+        ).order_by("id").values_list("id", "expected", field)
+        mismatches.extend(
+            (recipe_id, field, expected, stored)
+            for recipe_id, expected, stored in rows
+        )
+    return mismatches
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users.counters import find_mismatches, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики избранного и списков покупок у рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сверить счетчики, не пересчитывая их",
+        )
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            with transaction.atomic():
+                rebuild_counters()
+
+        mismatches = find_mismatches()
+        for recipe_id, field, expected, stored in mismatches:
+            self.stderr.write(
+                f"Рецепт {recipe_id}, {field}: "
+                f"ожидалось {expected}, сохранено {stored}"
+            )
+        if mismatches:
+            raise CommandError(f"Расхождений: {len(mismatches)}")
+        self.stdout.write(
+            "Счетчики рецептов совпадают с избранным и корзинами"
+        )
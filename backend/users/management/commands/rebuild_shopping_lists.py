@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users.shopping_list import find_mismatches, rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = "Пересобирает и сверяет агрегаты списков покупок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сверить агрегаты, не пересобирая их",
+        )
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            with transaction.atomic():
+                rebuild_shopping_lists()
+
+        mismatches = find_mismatches()
+        for user_id, ingredient_id, expected, stored in mismatches:
+            self.stderr.write(
+                f"Пользователь {user_id}, ингредиент {ingredient_id}: "
+                f"ожидалось {expected}, сохранено {stored}"
+            )
+        if mismatches:
+            raise CommandError(f"Расхождений: {len(mismatches)}")
+        self.stdout.write("Агрегаты списков покупок совпадают с корзинами")
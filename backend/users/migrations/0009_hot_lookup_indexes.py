@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:16
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def delete_duplicate_favourites(apps, schema_editor):
+    Favourite = apps.get_model("users", "Favourite")
+    keep_ids = Favourite.objects.values(
+        "user", "recipe"
+    ).annotate(keep_id=Min("id")).values("keep_id")
+    Favourite.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0008_alter_favourite_options_alter_follow_options_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_favourites, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="favourite",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_user_favourite"
+            ),
+        ),
+    ]
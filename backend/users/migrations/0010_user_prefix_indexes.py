@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:22
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0009_hot_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper(
+                        django.db.models.functions.comparison.Cast(
+                            "username", output_field=models.TextField()
+                        )
+                    ),
+                    name="text_pattern_ops",
+                ),
+                name="user_username_upper_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper(
+                        django.db.models.functions.comparison.Cast(
+                            "email", output_field=models.TextField()
+                        )
+                    ),
+                    name="text_pattern_ops",
+                ),
+                name="user_email_upper_idx",
+            ),
+        ),
+    ]
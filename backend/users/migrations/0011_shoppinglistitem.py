@@ -0,0 +1,69 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+FILL_SHOPPING_LISTS = """
+    INSERT INTO users_shoppinglistitem (user_id, ingredient_id, amount)
+    SELECT cart.user_id, ri.ingredient_id, SUM(ri.amount)
+    FROM users_shoppingcart AS cart
+    JOIN recipes_recipeingredient AS ri ON ri.recipe_id = cart.recipe_id
+    GROUP BY cart.user_id, ri.ingredient_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0017_hot_lookup_indexes"),
+        ("users", "0010_user_prefix_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShoppingListItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.IntegerField(verbose_name="Количество")),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="recipes.ingredient",
+                        verbose_name="Ингредиент",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_list_items",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "позиция списка покупок",
+                "verbose_name_plural": "Позиции списка покупок",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "ingredient"),
+                        name="unique_user_ingredient",
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(FILL_SHOPPING_LISTS, migrations.RunSQL.noop),
+    ]
@@ -1,8 +1,9 @@
 from django.contrib.auth.models import AbstractUser
 from django.core import validators
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
-from django.dispatch import receiver
-from recipes.models import Recipe
+from django.db.models.functions import Cast, Upper
+from recipes.models import Ingredient, Recipe
 
 
 class User(AbstractUser):
@@ -59,6 +60,22 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [
+            models.Index(
+                OpClass(
+                    Upper(Cast("username", output_field=models.TextField())),
+                    name="text_pattern_ops",
+                ),
+                name="user_username_upper_idx",
+            ),
+            models.Index(
+                OpClass(
+                    Upper(Cast("email", output_field=models.TextField())),
+                    name="text_pattern_ops",
+                ),
+                name="user_email_upper_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.username
@@ -104,26 +121,15 @@ class Favourite(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"], name="unique_user_favourite"
+            )
+        ]
         verbose_name = "избранное"
         verbose_name_plural = "Избранное"
 
 
-@receiver(models.signals.post_save, sender=Favourite)
-def update_recipe_favorite_status(sender, instance, created, **kwargs):
-    if created:
-        instance.recipe.is_favorited = True
-        instance.recipe.save()
-
-
-@receiver(models.signals.post_save, sender=Favourite)
-def update_recipe_unfavourite_status(sender, instance, created, **kwargs):
-    if created:
-        instance.recipe.is_favorited = Favourite.objects.filter(
-            recipe=instance.recipe
-        ).exists()
-        instance.recipe.save()
-
-
 class ShoppingCart(models.Model):
     user = models.ForeignKey(
         User,
@@ -146,3 +152,30 @@ class ShoppingCart(models.Model):
         ]
         verbose_name = "список покупок"
         verbose_name_plural = "Список покупок"
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Ингредиент",
+    )
+    amount = models.IntegerField(
+        verbose_name="Количество",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"], name="unique_user_ingredient"
+            )
+        ]
+        verbose_name = "позиция списка покупок"
+        verbose_name_plural = "Позиции списка покупок"
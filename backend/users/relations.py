@@ -0,0 +1,39 @@
+from django.db import connection
+
+from recipes.models import Recipe
+
+
+LINK_RECIPES = """
+    INSERT INTO {table} (user_id, recipe_id)
+    SELECT %s, id FROM {recipes} WHERE id = ANY(%s::bigint[])
+    FOR KEY SHARE
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+    RETURNING recipe_id
+"""
+UNLINK_RECIPES = """
+    DELETE FROM {table}
+    WHERE user_id = %s AND recipe_id = ANY(%s::bigint[])
+    RETURNING recipe_id
+"""
+
+
+def _execute(sql, model, user_id, recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.format(
+                table=model._meta.db_table, recipes=Recipe._meta.db_table
+            ),
+            [user_id, recipe_ids],
+        )
+        return [recipe_id for recipe_id, in cursor.fetchall()]
+
+
+def link_recipes(model, user_id, recipe_ids):
+    return _execute(LINK_RECIPES, model, user_id, recipe_ids)
+
+
+def unlink_recipes(model, user_id, recipe_ids):
+    return _execute(UNLINK_RECIPES, model, user_id, recipe_ids)
@@ -0,0 +1,124 @@
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient
+from services.redis import redis_client
+from .models import ShoppingListItem
+
+
+APPLY_RECIPE = """
+    INSERT INTO users_shoppinglistitem (user_id, ingredient_id, amount)
+    SELECT cart.user_id, ri.ingredient_id, %s * SUM(ri.amount)
+    FROM users_shoppingcart AS cart
+    JOIN recipes_recipeingredient AS ri ON ri.recipe_id = cart.recipe_id
+    WHERE cart.recipe_id = ANY(%s)
+    GROUP BY cart.user_id, ri.ingredient_id
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE
+    SET amount = users_shoppinglistitem.amount + EXCLUDED.amount
+    RETURNING user_id, ingredient_id, amount
+"""
+APPLY_USER_RECIPES = """
+    INSERT INTO users_shoppinglistitem (user_id, ingredient_id, amount)
+    SELECT %s, ri.ingredient_id, %s * SUM(ri.amount)
+    FROM recipes_recipeingredient AS ri
+    WHERE ri.recipe_id = ANY(%s)
+    GROUP BY ri.ingredient_id
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE
+    SET amount = users_shoppinglistitem.amount + EXCLUDED.amount
+    RETURNING user_id, ingredient_id, amount
+"""
+PRUNE_ITEMS = """
+    DELETE FROM users_shoppinglistitem AS item
+    USING unnest(%s::bigint[], %s::bigint[]) AS pruned (user_id, ingredient_id)
+    WHERE item.user_id = pruned.user_id
+    AND item.ingredient_id = pruned.ingredient_id
+    AND item.amount <= 0
+"""
+VERSION_PREFIX = "shopping_list:version"
+
+
+def make_list_version_key(user_id):
+    return f"{VERSION_PREFIX}:{user_id}"
+
+
+def get_list_version(user_id):
+    return int(redis_client.redis.get(make_list_version_key(user_id)) or 0)
+
+
+def bump_list_versions(user_ids):
+    pipe = redis_client.redis.pipeline()
+    for user_id in user_ids:
+        pipe.incr(make_list_version_key(user_id))
+    pipe.execute()
+
+
+def apply_recipes(recipe_ids, sign, user_id=None):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        if user_id is None:
+            cursor.execute(APPLY_RECIPE, [sign, recipe_ids])
+        else:
+            cursor.execute(APPLY_USER_RECIPES, [user_id, sign, recipe_ids])
+        rows = cursor.fetchall()
+        emptied = [(user, ingredient) for user, ingredient, amount in rows
+                   if amount <= 0]
+        if emptied:
+            cursor.execute(PRUNE_ITEMS, [list(pair) for pair in zip(*emptied)])
+    user_ids = {user for user, _, _ in rows}
+    if user_ids:
+        transaction.on_commit(lambda: bump_list_versions(user_ids))
+
+
+def add_to_shopping_list(user_id, recipe_ids):
+    apply_recipes(recipe_ids, 1, user_id)
+
+
+def remove_from_shopping_list(user_id, recipe_ids):
+    apply_recipes(recipe_ids, -1, user_id)
+
+
+def expected_totals():
+    rows = RecipeIngredient.objects.filter(
+        recipe__in_shopping_carts__isnull=False,
+    ).values_list(
+        "recipe__in_shopping_carts__user_id",
+        "ingredient_id",
+    ).annotate(
+        total=Sum("amount"),
+    ).order_by()
+    return {(user_id, ingredient_id): total
+            for user_id, ingredient_id, total in rows}
+
+
+def stored_totals():
+    rows = ShoppingListItem.objects.values_list(
+        "user_id", "ingredient_id", "amount"
+    )
+    return {(user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in rows}
+
+
+def rebuild_shopping_lists():
+    user_ids = set(
+        ShoppingListItem.objects.values_list("user_id", flat=True)
+    )
+    ShoppingListItem.objects.all().delete()
+    items = ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         amount=total)
+        for (user_id, ingredient_id), total in expected_totals().items()
+    )
+    user_ids.update(item.user_id for item in items)
+    transaction.on_commit(lambda: bump_list_versions(user_ids))
+
+
+def find_mismatches():
+    expected = expected_totals()
+    stored = stored_totals()
+    return [
+        (*key, expected.get(key), stored.get(key))
+        for key in sorted(expected.keys() | stored.keys())
+        if expected.get(key) != stored.get(key)
+    ]
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes.models import Recipe
+from .counters import adjust_counters
+from .models import Favourite, ShoppingCart
+from .shopping_list import apply_recipes
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    apply_recipes([instance.pk], -1)
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_save, sender=ShoppingCart)
+def count_added_recipe(sender, instance, created, **kwargs):
+    if created:
+        adjust_counters(sender, [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favourite)
+@receiver(post_delete, sender=ShoppingCart)
+def count_removed_recipe(sender, instance, origin=None, **kwargs):
+    if not isinstance(origin, Recipe):
+        adjust_counters(sender, [instance.recipe_id], -1)